@@ -1,16 +1,12 @@
 import streamlit as st
-from content_based_filtering import content_recommendation
-from scipy.sparse import load_npz
 import pandas as pd
-from collaborative_filtering import collaborative_recommendation
-from numpy import load
+from model_registry import get_models, recommend_row, suggest, CONTENT, COLLABORATIVE, ALS, HYBRID
+from hybrid_filtering import HYBRID_WEIGHT
+import instrumentation
 
-# Load datasets
-songs_data = pd.read_csv("data/cleaned_data.csv")
-transformed_data = load_npz("data/transformed_data.npz")
-track_ids = load("data/track_ids.npy", allow_pickle=True)
-filtered_data = pd.read_csv("data/collab_filtered_data.csv")
-interaction_matrix = load_npz("data/interaction_matrix.npz")
+# Open the bundle before the first query (the registry keeps one copy per server
+# process and reloads it when the bundle manifest names a new version)
+get_models()
 
 # Streamlit Page Configuration
 st.set_page_config(page_title="Spotify Recommender", page_icon="🎧", layout="centered")
@@ -63,38 +59,45 @@ st.markdown("<h1 style='text-align: center;'>🎧 Spotify Song Recommender</h1>"
 st.markdown("<p style='text-align: center;'>Discover songs similar to your favorites</p>", unsafe_allow_html=True)
 
 # --- Input Form ---
+st.markdown("### 🔍 Search for a Song")
+filtering_type = st.selectbox("Select the type of filtering:", ['Content-Based Filtering', 'Collaborative Filtering',
+                                                                 'Latent-Factor (ALS) Filtering', 'Hybrid Filtering'])
+if filtering_type == "Content-Based Filtering":
+    mode = CONTENT
+elif filtering_type == "Collaborative Filtering":
+    mode = COLLABORATIVE
+elif filtering_type == "Latent-Factor (ALS) Filtering":
+    mode = ALS
+else:
+    mode = HYBRID
+
+# suggestions tolerate partial names and typos; only songs the mode can use are listed
+query = st.text_input("Start typing a song name:")
+suggestions = suggest(query, 20, mode) if query.strip() else []
+selected = None
+if suggestions:
+    selected = st.selectbox("Pick a song:", suggestions,
+                            format_func=lambda suggestion: f"{suggestion[0].title()} — {suggestion[1].title()}")
+
 with st.form("recommendation_form"):
-    st.markdown("### 🔍 Search for a Song")
-    song_name = st.text_input("Enter a song name:")
-    artist_name = st.text_input("Enter the artist name:")
     k = st.select_slider("Number of recommendations", options=[5, 10, 15, 20], value=10)
-    filtering_type = st.selectbox("Select the type of filtering:", ['Content-Based Filtering', 'Collaborative Filtering'])
+    weight = HYBRID_WEIGHT
+    if mode == HYBRID:
+        weight = st.slider("Content weight (0 = listening history only, 1 = audio features only)",
+                           0.0, 1.0, HYBRID_WEIGHT, 0.05)
     submit_button = st.form_submit_button(label="Get Recommendations")
 
 # --- Recommendation Logic ---
 if submit_button:
-    song_name = song_name.lower().strip()
-    artist_name = artist_name.lower().strip()
-
-    if not song_name or not artist_name:
-        st.warning("Please enter both song name and artist name.")
+    if not query.strip():
+        st.warning("Please enter a song name.")
+    elif selected is None:
+        st.warning(f"❌ Couldn't find a song matching '{query.strip()}' in the dataset.")
     else:
         try:
-            if filtering_type == "Content-Based Filtering":
-                if ((songs_data["name"] == song_name) & (songs_data["artist"] == artist_name)).any():
-                    st.success(f"Recommendations for **{song_name.title()}** by **{artist_name.title()}**")
-                    recommendations = content_recommendation(song_name, songs_data, transformed_data, k)
-                    # content_recommendation(song_name=song_name, songs_data=songs_data, transformed_data=transformed_data, k=k)
-                else:
-                    st.warning(f"❌ Couldn't find '{song_name}' by '{artist_name}' in the dataset.")
-                    recommendations = None
-            else:
-                if ((filtered_data["name"] == song_name) & (filtered_data["artist"] == artist_name)).any():
-                    st.success(f"Recommendations for **{song_name.title()}** by **{artist_name.title()}**")
-                    recommendations = collaborative_recommendation(song_name, artist_name, track_ids, filtered_data, interaction_matrix, k)
-                else:
-                    st.warning(f"❌ Couldn't find '{song_name}' by '{artist_name}' in the dataset.")
-                    recommendations = None
+            song_name, artist_name, row = selected
+            st.success(f"Recommendations for **{song_name.title()}** by **{artist_name.title()}**")
+            recommendations = recommend_row(row, k, mode, weight=weight)
 
             # --- Display Results ---
             if recommendations is not None and not recommendations.empty:
@@ -146,3 +149,18 @@ if submit_button:
                         st.markdown("</div>", unsafe_allow_html=True)
         except Exception as e:
             st.error(f"Something went wrong: {str(e)}")
+
+# --- Optional Latency Debug Panel ---
+if st.sidebar.checkbox("Show latency metrics", value=False):
+    metrics = instrumentation.snapshot()
+    if not instrumentation.is_enabled():
+        st.sidebar.info("Latency metrics are disabled (RECOMMENDER_METRICS=0).")
+    elif not metrics:
+        st.sidebar.info("No recommendations timed yet.")
+    else:
+        rows = [
+            {"mode": mode, "phase": phase, **{key: value for key, value in summary.items() if key != "buckets"}}
+            for mode, phases in metrics.items()
+            for phase, summary in phases.items()
+        ]
+        st.sidebar.dataframe(pd.DataFrame(rows).round(3), hide_index=True)
@@ -0,0 +1,277 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix, load_npz
+from sklearn.preprocessing import normalize
+
+# File Paths
+BUNDLE_DIR = "data/bundle"
+SONGS_DATA_PATH = "data/cleaned_data.csv"
+TRANSFORMED_DATA_PATH = "data/transformed_data.npz"
+NEIGHBOR_INDEX_PATH = "data/content_neighbors.npz"
+COLLAB_NEIGHBOR_INDEX_PATH = "data/collab_neighbors.npz"
+TRACK_IDS_PATH = "data/track_ids.npy"
+USER_IDS_PATH = "data/user_ids.npy"
+FILTERED_DATA_PATH = "data/collab_filtered_data.csv"
+INTERACTION_MATRIX_PATH = "data/interaction_matrix.npz"
+NORMALIZED_MATRIX_PATH = "data/interaction_matrix_normalized.npz"
+VECTOR_STORE_DIR = "data/content_vectors"
+TRACK_FACTORS_PATH = "data/track_factors.npy"
+TRACK_ALIGNMENT_PATH = "data/track_alignment.npy"
+
+# names the live version directory inside the bundle; replaced atomically on export
+MANIFEST_NAME = "manifest.json"
+# version directories kept after an export, so workers still loading the previous one can finish
+VERSIONS_KEPT = 2
+
+
+def save_csr(matrix: csr_matrix, bundle_dir: str, name: str) -> None:
+    """Save the data/indices/indptr arrays of a CSR matrix as raw .npy files."""
+    matrix = matrix.tocsr()
+    np.save(os.path.join(bundle_dir, f"{name}.data.npy"), matrix.data)
+    np.save(os.path.join(bundle_dir, f"{name}.indices.npy"), matrix.indices)
+    np.save(os.path.join(bundle_dir, f"{name}.indptr.npy"), matrix.indptr)
+    np.save(os.path.join(bundle_dir, f"{name}.shape.npy"), np.asarray(matrix.shape, dtype=np.int64))
+
+
+def load_csr(bundle_dir: str, name: str) -> csr_matrix:
+    """Open a CSR matrix saved with `save_csr` without copying its arrays into memory."""
+    data, indices, indptr = (
+        np.load(os.path.join(bundle_dir, f"{name}.{part}.npy"), mmap_mode="r")
+        for part in ("data", "indices", "indptr")
+    )
+    shape = tuple(np.load(os.path.join(bundle_dir, f"{name}.shape.npy")).tolist())
+    return csr_matrix((data, indices, indptr), shape=shape, copy=False)
+
+
+def save_array(array: np.ndarray, bundle_dir: str, name: str) -> None:
+    """Save a numeric array as a raw .npy file."""
+    np.save(os.path.join(bundle_dir, f"{name}.npy"), np.ascontiguousarray(array))
+
+
+def load_array(bundle_dir: str, name: str) -> np.ndarray:
+    """Open a numeric array saved with `save_array` as a read-only memory map."""
+    return np.load(os.path.join(bundle_dir, f"{name}.npy"), mmap_mode="r")
+
+
+def save_strings(values: Any, bundle_dir: str, name: str) -> None:
+    """
+    Save strings in the Arrow large_string layout: one UTF-8 byte buffer,
+    n + 1 int64 offsets and a validity bitmap (one bit per value, LSB first).
+    """
+    values = pd.Series(values, dtype=object)
+    valid = values.notna().to_numpy()
+    encoded = [str(value).encode("utf-8") if present else b"" for value, present in zip(values, valid)]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    np.save(os.path.join(bundle_dir, f"{name}.bytes.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+    np.save(os.path.join(bundle_dir, f"{name}.offsets.npy"), offsets)
+    np.save(os.path.join(bundle_dir, f"{name}.validity.npy"), np.packbits(valid, bitorder="little"))
+
+
+def load_strings(bundle_dir: str, name: str) -> Any:
+    """
+    Open strings saved with `save_strings` without decoding them.
+
+    With pyarrow installed this is a pandas ArrowExtensionArray over the memory
+    mapped buffers: nothing is copied, and a string is decoded only when its
+    element is read. Without pyarrow every string is decoded into an object
+    array (None for nulls).
+    """
+    buffer, offsets, validity = (
+        np.load(os.path.join(bundle_dir, f"{name}.{part}.npy"), mmap_mode="r")
+        for part in ("bytes", "offsets", "validity")
+    )
+    n_values = len(offsets) - 1
+    try:
+        import pyarrow as pa
+    except ImportError:
+        valid = np.unpackbits(validity, count=n_values, bitorder="little").astype(bool)
+        text = memoryview(buffer)
+        values = np.empty(n_values, dtype=object)
+        values[:] = [
+            bytes(text[start:end]).decode("utf-8") if present else None
+            for start, end, present in zip(offsets[:-1].tolist(), offsets[1:].tolist(), valid.tolist())
+        ]
+        return values
+
+    array = pa.Array.from_buffers(
+        pa.large_string(), n_values, [pa.py_buffer(validity), pa.py_buffer(offsets), pa.py_buffer(buffer)]
+    )
+    return pd.arrays.ArrowExtensionArray(array)
+
+
+def save_table(data: pd.DataFrame, bundle_dir: str, name: str) -> None:
+    """Save a DataFrame column by column: numeric columns as .npy, text via `save_strings`."""
+    table_dir = os.path.join(bundle_dir, name)
+    os.makedirs(table_dir, exist_ok=True)
+    schema = []
+    for column in data.columns:
+        if pd.api.types.is_numeric_dtype(data[column]) or pd.api.types.is_bool_dtype(data[column]):
+            save_array(data[column].to_numpy(), table_dir, column)
+            schema.append({"name": column, "kind": "numeric"})
+        else:
+            save_strings(data[column], table_dir, column)
+            schema.append({"name": column, "kind": "string"})
+    with open(os.path.join(table_dir, "schema.json"), "w") as file:
+        json.dump(schema, file)
+
+
+def load_table(bundle_dir: str, name: str) -> pd.DataFrame:
+    """Open a DataFrame saved with `save_table`; its columns stay views of the memory-mapped files."""
+    table_dir = os.path.join(bundle_dir, name)
+    with open(os.path.join(table_dir, "schema.json")) as file:
+        schema = json.load(file)
+    columns = {
+        column["name"]: (
+            load_array(table_dir, column["name"])
+            if column["kind"] == "numeric"
+            else load_strings(table_dir, column["name"])
+        )
+        for column in schema
+    }
+    return pd.DataFrame(columns, copy=False)
+
+
+def write_bundle(bundle_dir: str) -> None:
+    """Convert the pipeline outputs into the memory-mappable bundle format in a new directory."""
+    # these modules save their structures with the helpers above, so they are imported here
+    from collaborative_filtering import build_song_rows
+    from search_index import build_search_index, save_search_index
+    from song_lookup import build_song_lookup, build_track_lookup, save_lookup
+
+    songs_data = pd.read_csv(SONGS_DATA_PATH)
+    filtered_data = pd.read_csv(FILTERED_DATA_PATH)
+    track_ids = np.load(TRACK_IDS_PATH, allow_pickle=True)
+    user_ids = np.load(USER_IDS_PATH, allow_pickle=True)
+    save_table(songs_data, bundle_dir, "songs_data")
+    save_table(filtered_data, bundle_dir, "filtered_data")
+    save_csr(load_npz(TRANSFORMED_DATA_PATH), bundle_dir, "transformed_data")
+    interaction_matrix = load_npz(INTERACTION_MATRIX_PATH)
+    save_csr(interaction_matrix, bundle_dir, "interaction_matrix")
+    # the transpose gives each user's played tracks as one CSR row
+    save_csr(interaction_matrix.T.tocsr(), bundle_dir, "user_tracks")
+    save_strings(user_ids, bundle_dir, "user_ids")
+    save_csr(load_npz(NORMALIZED_MATRIX_PATH), bundle_dir, "interaction_matrix_normalized")
+    save_strings(track_ids, bundle_dir, "track_ids")
+    save_array(np.load(TRACK_ALIGNMENT_PATH), bundle_dir, "track_alignment")
+
+    # lookups and search indexes are built here once instead of in every serving process
+    song_lookup = build_song_lookup(songs_data)
+    filtered_lookup = build_song_lookup(filtered_data)
+    save_lookup(song_lookup, bundle_dir, "song_lookup")
+    save_lookup(filtered_lookup, bundle_dir, "filtered_lookup")
+    save_lookup(build_track_lookup(track_ids), bundle_dir, "track_lookup")
+    save_lookup(build_track_lookup(user_ids), bundle_dir, "user_lookup")
+    save_search_index(build_search_index(song_lookup), bundle_dir, "search_index")
+    save_search_index(build_search_index(filtered_lookup), bundle_dir, "filtered_search_index")
+    save_array(build_song_rows(track_ids, filtered_data), bundle_dir, "song_rows")
+
+    with np.load(NEIGHBOR_INDEX_PATH) as neighbors:
+        save_array(neighbors["indices"], bundle_dir, "neighbor_indices")
+        save_array(neighbors["scores"], bundle_dir, "neighbor_scores")
+
+    with np.load(COLLAB_NEIGHBOR_INDEX_PATH) as neighbors:
+        save_array(neighbors["indices"], bundle_dir, "collab_neighbor_indices")
+        save_array(neighbors["scores"], bundle_dir, "collab_neighbor_scores")
+
+    # ALS track embeddings, normalized so a dot product is the cosine similarity
+    track_factors = np.load(TRACK_FACTORS_PATH)
+    save_array(normalize(track_factors, norm="l2", axis=1).astype(np.float32), bundle_dir, "track_factors")
+
+    # the vector store is already saved in the bundle format
+    shutil.copytree(VECTOR_STORE_DIR, os.path.join(bundle_dir, "content_vectors"))
+
+
+def read_manifest(bundle_dir: str = BUNDLE_DIR) -> dict[str, Any]:
+    """Return the bundle manifest: {"version": ..., "created": ...}."""
+    manifest_path = os.path.join(bundle_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        raise FileNotFoundError(f"No bundle manifest at {manifest_path}; run `python artifacts.py` first.")
+    with open(manifest_path) as file:
+        return json.load(file)
+
+
+def export_bundle(bundle_dir: str = BUNDLE_DIR) -> str:
+    """
+    Export a new bundle version and switch the manifest to it.
+
+    Serving processes keep the current files memory mapped, so no existing
+    file is ever opened for writing: the new version is written to a staging
+    directory, renamed to its version directory once complete, and only then
+    published by atomically replacing the manifest. Readers see either the old
+    or the new version, never a mix. The VERSIONS_KEPT newest versions stay;
+    older ones are unlinked, which leaves pages still mapped by a worker valid.
+    Returns the new version.
+    """
+    os.makedirs(bundle_dir, exist_ok=True)
+    version = f"v{time.time_ns()}"
+    staging_dir = tempfile.mkdtemp(prefix=".staging-", dir=bundle_dir)
+    try:
+        write_bundle(staging_dir)
+        os.replace(staging_dir, os.path.join(bundle_dir, version))
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    manifest = {"version": version, "created": time.strftime("%Y-%m-%dT%H:%M:%S%z")}
+    temp_path = os.path.join(bundle_dir, f".{MANIFEST_NAME}.tmp")
+    with open(temp_path, "w") as file:
+        json.dump(manifest, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, os.path.join(bundle_dir, MANIFEST_NAME))
+
+    versions = sorted(name for name in os.listdir(bundle_dir) if name.startswith("v"))
+    for name in versions[:-VERSIONS_KEPT]:
+        shutil.rmtree(os.path.join(bundle_dir, name), ignore_errors=True)
+    return version
+
+
+def load_bundle(bundle_dir: str = BUNDLE_DIR) -> dict[str, Any]:
+    """
+    Open every serving artifact of the version named by the bundle manifest.
+
+    Sparse matrices and numeric arrays are memory mapped, so opening them is
+    close to free and worker processes share the same pages of the page cache.
+    Text stays encoded in the mapped files until a value is read (see load_strings).
+    "version" and "path" identify the opened version. The content vector store
+    lives in its "content_vectors" subdirectory and is opened with
+    vector_store.load_vector_store; the lookups (song_lookup.load_lookup) and
+    search indexes (search_index.load_search_index) are opened the same way.
+    """
+    version = read_manifest(bundle_dir)["version"]
+    bundle_dir = os.path.join(bundle_dir, version)
+    return {
+        "version": version,
+        "path": bundle_dir,
+        "songs_data": load_table(bundle_dir, "songs_data"),
+        "filtered_data": load_table(bundle_dir, "filtered_data"),
+        "transformed_data": load_csr(bundle_dir, "transformed_data"),
+        "interaction_matrix": load_csr(bundle_dir, "interaction_matrix"),
+        "interaction_matrix_normalized": load_csr(bundle_dir, "interaction_matrix_normalized"),
+        "track_ids": load_strings(bundle_dir, "track_ids"),
+        "track_alignment": load_array(bundle_dir, "track_alignment"),
+        "song_rows": load_array(bundle_dir, "song_rows"),
+        "user_tracks": load_csr(bundle_dir, "user_tracks"),
+        "user_ids": load_strings(bundle_dir, "user_ids"),
+        "neighbor_index": (
+            load_array(bundle_dir, "neighbor_indices"),
+            load_array(bundle_dir, "neighbor_scores"),
+        ),
+        "collab_neighbor_index": (
+            load_array(bundle_dir, "collab_neighbor_indices"),
+            load_array(bundle_dir, "collab_neighbor_scores"),
+        ),
+        "track_factors": load_array(bundle_dir, "track_factors"),
+    }
+
+
+if __name__ == "__main__":
+    export_bundle()
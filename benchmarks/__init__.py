@@ -0,0 +1,14 @@
+"""
+Offline benchmarks for the recommendation pipeline.
+
+Generates synthetic Music_Info / User_Listening_History data at a chosen scale
+and times every pipeline stage and both recommenders:
+
+    python -m benchmarks.run --tracks 10000 --interactions 100000
+
+Measures recommendation quality (recall@k, NDCG@k) against throughput on a
+per-user holdout of the listening history, run from the repository root
+after the pipeline:
+
+    python -m benchmarks.evaluation --users 2000 -k 10
+"""
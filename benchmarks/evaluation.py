@@ -0,0 +1,336 @@
+import argparse
+import json
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix, csr_matrix, load_npz
+from sklearn.preprocessing import normalize
+
+from collaborative_filtering import SONGS_DATA_PATH, USER_HISTORY_PATH, normalize_interaction_matrix
+from content_based_filtering import TRANSFORMED_DATA_PATH
+from latent_factors import FACTORS, ITERATIONS, normalize_factors, train_als
+from neighbor_index import NEIGHBOR_INDEX_PATH, NEIGHBOR_K, build_neighbor_index, load_neighbor_index
+from ranking import top_k_indices
+from vector_store import CANDIDATE_FACTOR, MIN_CANDIDATES, SCAN_BLOCK_ROWS, VECTOR_STORE_DIR, load_vector_store
+
+EVAL_USERS = 2000
+HOLDOUT_FRACTION = 0.2
+MIN_TRACKS = 5
+USER_BLOCK_SIZE = 256
+MODES = (
+    "content", "content_neighbors", "content_int8",
+    "collaborative", "collaborative_neighbors", "als",
+)
+
+Scorer = Callable[[csr_matrix], np.ndarray]
+
+
+@dataclass
+class Split:
+    """A per-user holdout of the listening history, in track-code space."""
+
+    train: csr_matrix
+    seeds: csr_matrix
+    targets: csr_matrix
+    track_ids: np.ndarray
+
+
+def split_history(
+    history_path: str = USER_HISTORY_PATH,
+    n_users: int = EVAL_USERS,
+    holdout_fraction: float = HOLDOUT_FRACTION,
+    min_tracks: int = MIN_TRACKS,
+    seed: int = 0
+) -> Split:
+    """
+    Hold out a share of the tracks of a sample of users.
+
+    Users with at least `min_tracks` distinct tracks are eligible. For each
+    sampled user, `holdout_fraction` of their tracks (at least one) are moved to
+    the targets; everything else, including all other users, is training data.
+    `train` is the tracks x users playcount matrix without the held-out events,
+    `seeds` and `targets` are binary (sampled users x tracks) matrices.
+    """
+    history = pd.read_csv(
+        history_path,
+        usecols=["track_id", "user_id", "playcount"],
+        dtype={"track_id": str, "user_id": str, "playcount": np.float64},
+    )
+    track_codes, track_ids = pd.factorize(history["track_id"])
+    user_codes, user_ids = pd.factorize(history["user_id"])
+    events = coo_matrix(
+        (history["playcount"].to_numpy(), (track_codes, user_codes)), shape=(len(track_ids), len(user_ids))
+    ).tocsr().tocoo()
+    del history
+
+    rng = np.random.default_rng(seed)
+    tracks_per_user = np.bincount(events.col, minlength=len(user_ids))
+    eligible = np.flatnonzero(tracks_per_user >= min_tracks)
+    sampled = np.sort(rng.choice(eligible, min(n_users, len(eligible)), replace=False))
+    position = np.full(len(user_ids), -1)
+    position[sampled] = np.arange(len(sampled))
+
+    # rank the entries of each sampled user in a random order and hold out the first ones
+    entries = np.flatnonzero(position[events.col] >= 0)
+    entries = entries[np.lexsort((rng.random(len(entries)), events.col[entries]))]
+    users = events.col[entries]
+    starts = np.searchsorted(users, users, side="left")
+    rank = np.arange(len(entries)) - starts
+    n_held = np.maximum(1, (tracks_per_user[users] * holdout_fraction).astype(np.int64))
+    held = np.zeros(events.nnz, dtype=bool)
+    held[entries[rank < n_held]] = True
+
+    def user_matrix(mask: np.ndarray) -> csr_matrix:
+        return csr_matrix(
+            (np.ones(mask.sum(), dtype=np.float32), (position[events.col[mask]], events.row[mask])),
+            shape=(len(sampled), len(track_ids)),
+        )
+
+    in_sample = position[events.col] >= 0
+    train = csr_matrix(
+        (events.data[~held], (events.row[~held], events.col[~held])), shape=events.shape
+    )
+    return Split(
+        train=train,
+        seeds=user_matrix(in_sample & ~held),
+        targets=user_matrix(held),
+        track_ids=np.asarray(track_ids, dtype=object),
+    )
+
+
+def ranking_metrics(top: np.ndarray, targets: csr_matrix, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Per-user recall@k and NDCG@k of ranked track codes against binary targets.
+
+    Recall is normalized by min(k, number of targets), so a perfect ranking scores 1.
+    """
+    hits = np.take_along_axis(targets.toarray() > 0, top, axis=1)
+    n_targets = np.minimum(np.diff(targets.indptr), k)
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    ideal = np.cumsum(discounts)[np.maximum(n_targets, 1) - 1]
+    return hits.sum(axis=1) / np.maximum(n_targets, 1), (hits @ discounts[:hits.shape[1]]) / ideal
+
+
+def evaluate_scorer(
+    score: Scorer, split: Split, k: int, block_size: int = USER_BLOCK_SIZE
+) -> dict[str, float]:
+    """
+    Score every sampled user in blocks, rank the tracks they did not train on and
+    measure recall@k / NDCG@k. Only scoring and ranking are timed.
+    """
+    recalls, ndcgs = [], []
+    elapsed = 0.0
+    n_users = split.seeds.shape[0]
+    for start in range(0, n_users, block_size):
+        seeds = split.seeds[start:start + block_size]
+        began = time.perf_counter()
+        scores = score(seeds)
+        rows, columns = seeds.nonzero()
+        scores[rows, columns] = -np.inf
+        top = top_k_indices(scores, k)
+        elapsed += time.perf_counter() - began
+
+        recall, ndcg = ranking_metrics(top, split.targets[start:start + block_size], k)
+        recalls.append(recall)
+        ndcgs.append(ndcg)
+
+    return {
+        "users": n_users,
+        "score_s": elapsed,
+        "users_per_s": n_users / elapsed if elapsed else float("inf"),
+        f"recall@{k}": float(np.concatenate(recalls).mean()),
+        f"ndcg@{k}": float(np.concatenate(ndcgs).mean()),
+    }
+
+
+def neighbor_matrix(indices: np.ndarray, scores: np.ndarray) -> csr_matrix:
+    """Turn a fixed-width neighbour index into a sparse (rows x rows) similarity matrix."""
+    n_rows, width = indices.shape
+    return csr_matrix(
+        (np.asarray(scores, dtype=np.float32).ravel(), np.asarray(indices).ravel(),
+         np.arange(0, n_rows * width + 1, width)),
+        shape=(n_rows, n_rows),
+    )
+
+
+class ContentSpace:
+    """Maps seed matrices from track codes to catalog rows and scores back again."""
+
+    def __init__(self, track_ids: np.ndarray, songs_path: str = SONGS_DATA_PATH) -> None:
+        songs = pd.read_csv(songs_path, usecols=["track_id"])
+        self.rows = pd.Index(songs["track_id"]).get_indexer(track_ids)
+        self.known = np.flatnonzero(self.rows >= 0)
+        self.to_catalog = csr_matrix(
+            (np.ones(len(self.known), dtype=np.float32), (self.known, self.rows[self.known])),
+            shape=(len(track_ids), len(songs)),
+        )
+
+    def seeds(self, seeds: csr_matrix) -> csr_matrix:
+        """Seed matrix over catalog rows."""
+        return (seeds @ self.to_catalog).tocsr()
+
+    def scores(self, catalog_scores: np.ndarray) -> np.ndarray:
+        """Catalog-row scores to track-code scores; tracks without metadata get -inf."""
+        scores = np.full((catalog_scores.shape[0], len(self.rows)), -np.inf, dtype=np.float32)
+        scores[:, self.known] = catalog_scores[:, self.rows[self.known]]
+        return scores
+
+
+def content_scorer(space: ContentSpace, transformed_path: str = TRANSFORMED_DATA_PATH) -> Scorer:
+    """Exact cosine scoring of every track against the seed profile."""
+    vectors = normalize(load_npz(transformed_path), norm="l2", axis=1).astype(np.float32).tocsr()
+
+    def score(seeds: csr_matrix) -> np.ndarray:
+        profile = (space.seeds(seeds) @ vectors).toarray()
+        return space.scores(np.asarray(vectors @ profile.T).T)
+
+    return score
+
+
+def content_neighbors_scorer(space: ContentSpace, neighbor_path: str = NEIGHBOR_INDEX_PATH) -> Scorer:
+    """Scores summed over the precomputed content neighbours of the seeds."""
+    neighbors = neighbor_matrix(*load_neighbor_index(neighbor_path))
+
+    def score(seeds: csr_matrix) -> np.ndarray:
+        return space.scores((space.seeds(seeds) @ neighbors).toarray())
+
+    return score
+
+
+def content_int8_scorer(space: ContentSpace, k: int, store_dir: str = VECTOR_STORE_DIR) -> Scorer:
+    """
+    The vector store's quantized path: int8 dense scores select candidates that
+    are re-ranked with the exact float32 dense scores (the sparse block is exact).
+    """
+    store = load_vector_store(store_dir)
+    n_candidates = max(k * CANDIDATE_FACTOR, MIN_CANDIDATES)
+
+    def score(seeds: csr_matrix) -> np.ndarray:
+        catalog_seeds = space.seeds(seeds)
+        dense_profile = np.asarray(catalog_seeds @ store.dense, dtype=np.float32)
+        sparse_scores = np.asarray((store.sparse @ (catalog_seeds @ store.sparse).T).toarray()).T
+
+        approximate = sparse_scores.copy()
+        for start in range(0, store.quantized.shape[0], SCAN_BLOCK_ROWS):
+            end = start + SCAN_BLOCK_ROWS
+            block = store.quantized[start:end].astype(np.float32)
+            approximate[:, start:end] += (dense_profile @ block.T) * store.scales[start:end]
+        scores = space.scores(approximate)
+        scores[seeds.nonzero()] = -np.inf
+
+        # exact dense scores for the candidates only; everything else drops out
+        candidates = top_k_indices(scores, n_candidates)
+        catalog_rows = space.rows[candidates]
+        valid = catalog_rows >= 0
+        catalog_rows = np.where(valid, catalog_rows, 0)
+        exact = np.take_along_axis(sparse_scores, catalog_rows, axis=1) + np.einsum(
+            "ucd,ud->uc", store.dense[catalog_rows], dense_profile
+        )
+        reranked = np.full_like(scores, -np.inf)
+        np.put_along_axis(reranked, candidates, np.where(valid, exact, -np.inf), axis=1)
+        return reranked
+
+    return score
+
+
+def collaborative_scorer(train: csr_matrix) -> Scorer:
+    """Item-item cosine scores on the training interactions."""
+    normalized = normalize_interaction_matrix(train)
+
+    def score(seeds: csr_matrix) -> np.ndarray:
+        return (normalized @ (seeds @ normalized).T).toarray().T
+
+    return score
+
+
+def collaborative_neighbors_scorer(train: csr_matrix) -> Scorer:
+    """Scores summed over neighbour lists precomputed from the training interactions."""
+    neighbors = neighbor_matrix(*build_neighbor_index(train, NEIGHBOR_K))
+
+    def score(seeds: csr_matrix) -> np.ndarray:
+        return (seeds @ neighbors).toarray()
+
+    return score
+
+
+def als_scorer(train: csr_matrix, factors: int = FACTORS, iterations: int = ITERATIONS) -> Scorer:
+    """Cosine scores of ALS track embeddings trained on the training interactions."""
+    track_factors, _ = train_als(train, factors=factors, iterations=iterations)
+    embeddings = normalize_factors(track_factors)
+
+    def score(seeds: csr_matrix) -> np.ndarray:
+        return np.asarray(seeds @ embeddings) @ embeddings.T
+
+    return score
+
+
+def run_evaluation(
+    modes: tuple[str, ...] = MODES,
+    k: int = 10,
+    n_users: int = EVAL_USERS,
+    holdout_fraction: float = HOLDOUT_FRACTION,
+    min_tracks: int = MIN_TRACKS,
+    als_iterations: int = ITERATIONS,
+    seed: int = 0
+) -> dict[str, Any]:
+    """
+    Evaluate the requested modes on one holdout split of the listening history.
+
+    The collaborative models are rebuilt on the training part; the content
+    artifacts do not depend on the history and are read from the pipeline outputs.
+    """
+    split = split_history(USER_HISTORY_PATH, n_users, holdout_fraction, min_tracks, seed)
+    space = ContentSpace(split.track_ids) if any(mode.startswith("content") for mode in modes) else None
+    builders: dict[str, Callable[[], Scorer]] = {
+        "content": lambda: content_scorer(space),
+        "content_neighbors": lambda: content_neighbors_scorer(space),
+        "content_int8": lambda: content_int8_scorer(space, k),
+        "collaborative": lambda: collaborative_scorer(split.train),
+        "collaborative_neighbors": lambda: collaborative_neighbors_scorer(split.train),
+        "als": lambda: als_scorer(split.train, iterations=als_iterations),
+    }
+
+    results = []
+    for mode in modes:
+        start = time.perf_counter()
+        scorer = builders[mode]()
+        build_s = time.perf_counter() - start
+        results.append({"mode": mode, "build_s": build_s, **evaluate_scorer(scorer, split, k)})
+
+    return {
+        "config": {
+            "k": k, "users": split.seeds.shape[0], "tracks": split.train.shape[0],
+            "holdout_fraction": holdout_fraction, "min_tracks": min_tracks, "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Offline recall/NDCG and throughput of the recommenders.")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("-k", type=int, default=10, help="recommendations per user")
+    parser.add_argument("--users", type=int, default=EVAL_USERS, help="number of held-out users")
+    parser.add_argument("--holdout", type=float, default=HOLDOUT_FRACTION, help="share of tracks held out per user")
+    parser.add_argument("--min-tracks", type=int, default=MIN_TRACKS, help="minimum distinct tracks per user")
+    parser.add_argument("--als-iterations", type=int, default=ITERATIONS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default="", help="also write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    report = run_evaluation(
+        tuple(args.modes), args.k, args.users, args.holdout, args.min_tracks, args.als_iterations, args.seed
+    )
+    print("config:", ", ".join(f"{key}={value}" for key, value in report["config"].items()))
+    print(pd.DataFrame(report["results"]).to_string(index=False, float_format="%.4f"))
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
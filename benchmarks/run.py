@@ -0,0 +1,242 @@
+import argparse
+import glob
+import json
+import os
+import resource
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import load_npz
+
+from benchmarks.synthetic import write_dataset
+from collaborative_filtering import build_interaction_data, build_song_rows, collaborative_recommendation
+from content_based_filtering import content_recommendation, train_transformer, transform_data
+from data_cleaning import clean_data, data_for_content_filtering
+from neighbor_index import build_neighbor_index
+from song_lookup import build_song_lookup, build_track_lookup
+
+SAMPLE_INTERVAL_SECONDS = 0.01
+PERCENTILES = (50, 95, 99)
+
+
+def process_rss_bytes(pid: str) -> int:
+    """Resident set size of one process from /proc (0 when it has exited)."""
+    try:
+        with open(f"/proc/{pid}/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def child_pids(parent: int) -> list[str]:
+    """Every live descendant of `parent`, found through the parent IDs in /proc."""
+    children: dict[int, list[str]] = {}
+    for stat_path in glob.glob("/proc/[0-9]*/stat"):
+        try:
+            with open(stat_path) as file:
+                # the command name may contain spaces, so split after its closing parenthesis
+                ppid = int(file.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(stat_path.split("/")[2])
+
+    descendants, pending = [], [parent]
+    while pending:
+        for pid in children.get(pending.pop(), []):
+            descendants.append(pid)
+            pending.append(int(pid))
+    return descendants
+
+
+def current_rss_bytes() -> int:
+    """
+    Resident set size of this process plus its worker processes (falls back to
+    the peak RSS of this process and of its finished children off Linux).
+
+    Pages shared with forked workers are counted once per process, so with
+    process pools this is an upper bound on the physical memory used.
+    """
+    if not os.path.exists("/proc/self/statm"):
+        return max(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        ) * 1024
+    return process_rss_bytes("self") + sum(process_rss_bytes(pid) for pid in child_pids(os.getpid()))
+
+
+@contextmanager
+def peak_rss() -> Iterator[dict[str, int]]:
+    """Sample the RSS in a background thread and report the peak seen inside the block."""
+    result = {"peak": current_rss_bytes()}
+    stop = threading.Event()
+
+    def sample() -> None:
+        while not stop.is_set():
+            result["peak"] = max(result["peak"], current_rss_bytes())
+            stop.wait(SAMPLE_INTERVAL_SECONDS)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        yield result
+    finally:
+        stop.set()
+        sampler.join()
+        result["peak"] = max(result["peak"], current_rss_bytes())
+
+
+def measure_stage(stages: list[dict[str, Any]], name: str, func: Callable[..., Any], *args: Any) -> Any:
+    """Run one pipeline stage, appending its wall time and peak RSS to `stages`."""
+    with peak_rss() as rss:
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+    stages.append({"stage": name, "wall_s": elapsed, "peak_rss_mb": rss["peak"] / 2**20})
+    return result
+
+
+def measure_queries(name: str, func: Callable[[Any], Any], queries: list[Any]) -> dict[str, Any]:
+    """Time `func` once per query and summarise the latency distribution in milliseconds."""
+    timings = np.empty(len(queries))
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        func(query)
+        timings[i] = time.perf_counter() - start
+    timings *= 1000.0
+    summary = {"mode": name, "queries": len(queries), "mean_ms": float(timings.mean())}
+    for percentile in PERCENTILES:
+        summary[f"p{percentile}_ms"] = float(np.percentile(timings, percentile))
+    return summary
+
+
+def run_benchmark(
+    n_tracks: int,
+    n_interactions: int,
+    n_users: int = 0,
+    n_queries: int = 200,
+    k: int = 10,
+    workdir: str = "",
+    seed: int = 0
+) -> dict[str, Any]:
+    """Generate a synthetic dataset in `workdir` and benchmark every stage and recommender."""
+    # absolute, so data_dir stays valid after the chdir below
+    workdir = os.path.abspath(workdir or tempfile.mkdtemp(prefix="spotify-bench-"))
+    data_dir = os.path.join(workdir, "data")
+    stages: list[dict[str, Any]] = []
+    previous_dir = os.getcwd()
+    # train_transformer/transform_data read and write transformer.joblib in the working directory
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    try:
+        music_path, history_path = measure_stage(
+            stages, "generate_data", write_dataset, data_dir, n_tracks, n_interactions, n_users, seed
+        )
+
+        def clean() -> pd.DataFrame:
+            cleaned = clean_data(pd.read_csv(music_path))
+            cleaned.to_csv(os.path.join(data_dir, "cleaned_data.csv"), index=False)
+            return cleaned
+
+        songs_data = measure_stage(stages, "clean_data", clean)
+        content_data = data_for_content_filtering(songs_data)
+        measure_stage(stages, "train_transformer", train_transformer, content_data)
+        transformed_data = measure_stage(stages, "transform_data", transform_data, content_data)
+        neighbor_index = measure_stage(stages, "build_neighbor_index", build_neighbor_index, transformed_data)
+        _, track_ids, filtered_data = measure_stage(
+            stages,
+            "build_interaction_data",
+            build_interaction_data,
+            history_path,
+            songs_data,
+            os.path.join(data_dir, "track_ids.npy"),
+            os.path.join(data_dir, "collab_filtered_data.csv"),
+            os.path.join(data_dir, "interaction_matrix.npz"),
+            os.path.join(data_dir, "interaction_matrix_normalized.npz"),
+        )
+        normalized_matrix = load_npz(os.path.join(data_dir, "interaction_matrix_normalized.npz"))
+    finally:
+        os.chdir(previous_dir)
+
+    rng = np.random.default_rng(seed)
+    song_lookup = build_song_lookup(songs_data)
+    filtered_lookup = build_song_lookup(filtered_data)
+    track_lookup = build_track_lookup(track_ids)
+    song_rows = build_song_rows(track_ids, filtered_data)
+
+    content_queries = songs_data[["name", "artist"]].iloc[rng.integers(0, len(songs_data), n_queries)]
+    content_queries = list(content_queries.itertuples(index=False, name=None))
+    collab_queries = filtered_data[["name", "artist"]].iloc[rng.integers(0, len(filtered_data), n_queries)]
+    collab_queries = list(collab_queries.itertuples(index=False, name=None))
+
+    queries = [
+        measure_queries(
+            "content_live",
+            lambda q: content_recommendation(
+                q[0], songs_data, transformed_data, k, artist_name=q[1], song_lookup=song_lookup
+            ),
+            content_queries,
+        ),
+        measure_queries(
+            "content_neighbor_index",
+            lambda q: content_recommendation(
+                q[0], songs_data, transformed_data, k, neighbor_index, artist_name=q[1], song_lookup=song_lookup
+            ),
+            content_queries,
+        ),
+        measure_queries(
+            "collaborative",
+            lambda q: collaborative_recommendation(
+                q[0], q[1], track_ids, filtered_data, normalized_matrix, k,
+                song_lookup=filtered_lookup, track_lookup=track_lookup, normalized=True, song_rows=song_rows
+            ),
+            collab_queries,
+        ),
+    ]
+
+    return {
+        "config": {
+            "tracks": n_tracks, "interactions": n_interactions, "users": n_users,
+            "queries": n_queries, "k": k, "workdir": workdir,
+        },
+        "stages": stages,
+        "queries": queries,
+    }
+
+
+def print_report(report: dict[str, Any]) -> None:
+    """Print the benchmark results as two plain-text tables."""
+    print("config:", ", ".join(f"{key}={value}" for key, value in report["config"].items()))
+    print(pd.DataFrame(report["stages"]).to_string(index=False, float_format="%.3f"))
+    print()
+    print(pd.DataFrame(report["queries"]).to_string(index=False, float_format="%.3f"))
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark the recommendation pipeline on synthetic data.")
+    parser.add_argument("--tracks", type=int, default=10_000, help="number of catalog tracks")
+    parser.add_argument("--interactions", type=int, default=100_000, help="number of listening events")
+    parser.add_argument("--users", type=int, default=0, help="number of users (default: interactions / 20)")
+    parser.add_argument("--queries", type=int, default=200, help="queries timed per recommender")
+    parser.add_argument("-k", type=int, default=10, help="recommendations per query")
+    parser.add_argument("--workdir", default="", help="directory for generated data (default: a temp dir)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default="", help="also write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(
+        args.tracks, args.interactions, args.users, args.queries, args.k, args.workdir, args.seed
+    )
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+TAG_VOCABULARY_SIZE = 500
+MAX_TAGS_PER_TRACK = 6
+
+
+def track_id_strings(codes: np.ndarray) -> np.ndarray:
+    """Format integer codes as Music_Info style track IDs."""
+    return np.char.add("TR", np.char.zfill(codes.astype(str), 10))
+
+
+def generate_catalog(n_tracks: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Generate a synthetic catalog with the Music_Info.csv schema expected by `clean_data`.
+
+    A small share of rows reuse a spotify_id (duplicates) and have no tags, so the
+    cleaning steps have work to do.
+    """
+    rng = np.random.default_rng(seed)
+    n_artists = max(1, n_tracks // 8)
+    vocabulary = np.array([f"tag{i}" for i in range(TAG_VOCABULARY_SIZE)])
+    tag_counts = rng.integers(1, MAX_TAGS_PER_TRACK + 1, n_tracks)
+    tag_words = vocabulary[rng.zipf(1.3, tag_counts.sum()) % TAG_VOCABULARY_SIZE]
+    tags = np.split(tag_words, np.cumsum(tag_counts)[:-1])
+
+    codes = np.arange(n_tracks)
+    spotify_codes = np.where(rng.random(n_tracks) < 0.01, rng.integers(0, n_tracks, n_tracks), codes)
+    return pd.DataFrame({
+        "track_id": track_id_strings(codes),
+        "name": np.char.add("Song ", codes.astype(str)),
+        "artist": np.char.add("Artist ", rng.zipf(1.5, n_tracks).clip(max=n_artists).astype(str)),
+        "spotify_preview_url": np.where(
+            rng.random(n_tracks) < 0.9, np.char.add("https://p.scdn.co/mp3-preview/", codes.astype(str)), None
+        ),
+        "spotify_id": np.char.add("SP", spotify_codes.astype(str)),
+        "tags": [", ".join(words) if rng.random() < 0.95 else None for words in tags],
+        "genre": np.where(rng.random(n_tracks) < 0.5, "Rock", None),
+        "year": rng.integers(1950, 2023, n_tracks),
+        "duration_ms": rng.integers(60_000, 600_000, n_tracks),
+        "danceability": rng.random(n_tracks),
+        "energy": rng.random(n_tracks),
+        "key": rng.integers(0, 12, n_tracks),
+        "loudness": rng.normal(-8.0, 4.0, n_tracks),
+        "mode": rng.integers(0, 2, n_tracks),
+        "speechiness": rng.beta(1, 8, n_tracks),
+        "acousticness": rng.random(n_tracks),
+        "instrumentalness": rng.beta(1, 3, n_tracks),
+        "liveness": rng.beta(2, 8, n_tracks),
+        "valence": rng.random(n_tracks),
+        "tempo": rng.normal(120.0, 25.0, n_tracks),
+        "time_signature": rng.choice([3, 4, 5], n_tracks, p=[0.1, 0.85, 0.05]),
+    })
+
+
+def generate_history(
+    n_tracks: int, n_interactions: int, n_users: int = 0, seed: int = 0
+) -> pd.DataFrame:
+    """
+    Generate a synthetic User_Listening_History.csv table.
+
+    Track popularity follows a power law, and a few percent of the events
+    reference tracks that are not in the catalog, as in the real data.
+    """
+    rng = np.random.default_rng(seed + 1)
+    n_users = n_users or max(1, n_interactions // 20)
+    popularity = 1.0 / np.arange(1, n_tracks + 1) ** 0.8
+    ranks = rng.choice(n_tracks, n_interactions, p=popularity / popularity.sum())
+    track_codes = rng.permutation(n_tracks)[ranks]
+    unknown = rng.random(n_interactions) < 0.02
+    track_codes[unknown] = n_tracks + rng.integers(0, n_tracks, unknown.sum())
+    return pd.DataFrame({
+        "track_id": track_id_strings(track_codes),
+        "user_id": np.char.add("U", rng.integers(0, n_users, n_interactions).astype(str)),
+        "playcount": rng.geometric(0.4, n_interactions),
+    })
+
+
+def write_dataset(
+    data_dir: str, n_tracks: int, n_interactions: int, n_users: int = 0, seed: int = 0
+) -> tuple[str, str]:
+    """Write Music_Info.csv and User_Listening_History.csv and return their paths."""
+    os.makedirs(data_dir, exist_ok=True)
+    music_path = os.path.join(data_dir, "Music_Info.csv")
+    history_path = os.path.join(data_dir, "User_Listening_History.csv")
+    generate_catalog(n_tracks, seed).to_csv(music_path, index=False)
+    generate_history(n_tracks, n_interactions, n_users, seed).to_csv(history_path, index=False)
+    return music_path, history_path
@@ -1,16 +1,30 @@
+import argparse
 import pandas as pd
-import dask.dataframe as dd
-from scipy.sparse import csr_matrix, save_npz
+from scipy.sparse import csr_matrix, coo_matrix, save_npz, load_npz
 import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+from collections.abc import Mapping
+from typing import Optional, Union
+# the recommenders import their lookup, ranking and timing helpers themselves, so the
+# interaction_data stage only depends on the modules it actually runs
 
 # File Paths
 TRACK_IDS_SAVE_PATH = "data/track_ids.npy"
+USER_IDS_SAVE_PATH = "data/user_ids.npy"
 FILTERED_DATA_SAVE_PATH = "data/collab_filtered_data.csv"
 INTERACTION_MATRIX_SAVE_PATH = "data/interaction_matrix.npz"
+NORMALIZED_MATRIX_SAVE_PATH = "data/interaction_matrix_normalized.npz"
+TRACK_ALIGNMENT_SAVE_PATH = "data/track_alignment.npy"
 SONGS_DATA_PATH = "data/cleaned_data.csv"
 USER_HISTORY_PATH = "data/User_Listening_History.csv"
 
+# Streaming builder settings
+HISTORY_CHUNK_SIZE = 1_000_000
+MAX_BUFFER_MB = 512
+# int32 track code + int32 user code + float64 playcount per buffered event
+BYTES_PER_EVENT = 16
+
 
 def save_dataframe(data: pd.DataFrame, path: str) -> None:
     """Save a pandas DataFrame to CSV."""
@@ -29,28 +43,212 @@ def filter_songs(songs: pd.DataFrame, track_ids: list[str], save_path: str) -> p
     return filtered
 
 
-def create_interaction_matrix(
-    history: dd.DataFrame, track_ids_path: str, matrix_save_path: str
+def normalize_interaction_matrix(matrix: csr_matrix) -> csr_matrix:
+    """L2-normalize every track row and store the result as float32 CSR."""
+    return normalize(matrix.astype(np.float32), norm="l2", axis=1).tocsr()
+
+
+def build_song_rows(track_ids: np.ndarray, songs_df: pd.DataFrame) -> np.ndarray:
+    """Map every interaction matrix row to its songs_df row (-1 when the song is missing)."""
+    return pd.Index(songs_df["track_id"]).get_indexer(track_ids)
+
+
+def save_track_alignment(track_ids: np.ndarray, songs: pd.DataFrame, path: str) -> None:
+    """
+    Save the cleaned_data / transformed_data row of every interaction matrix row
+    (-1 when the track has no metadata), so both models can score the same tracks.
+    """
+    np.save(path, build_song_rows(track_ids, songs).astype(np.int64))
+
+
+def assign_codes(values: pd.Series, codes: dict[str, int]) -> np.ndarray:
+    """Map values to stable integer codes, giving unseen values the next free code."""
+    local_codes, uniques = pd.factorize(values)
+    global_codes = np.fromiter(
+        (codes.setdefault(value, len(codes)) for value in uniques),
+        dtype=np.int32,
+        count=len(uniques),
+    )
+    return global_codes[local_codes]
+
+
+def merge_coo_block(
+    matrix: csr_matrix,
+    rows: list[np.ndarray],
+    cols: list[np.ndarray],
+    values: list[np.ndarray],
+    shape: tuple[int, int]
 ) -> csr_matrix:
-    """Generate and save a sparse interaction matrix."""
-    history = history.copy()
-    history['playcount'] = history['playcount'].astype(np.float64)
-    history = history.categorize(columns=['user_id', 'track_id'])
+    """Sum buffered COO entries into the running CSR matrix, growing it to `shape`."""
+    block = coo_matrix(
+        (np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))), shape=shape
+    ).tocsr()
+    matrix.resize(shape)
+    return (matrix + block).tocsr()
 
-    user_codes = history['user_id'].cat.codes
-    track_codes = history['track_id'].cat.codes
-    track_ids = history['track_id'].cat.categories.values
 
-    np.save(track_ids_path, track_ids, allow_pickle=True)
+def stream_interaction_matrix(
+    history_path: str,
+    chunksize: int = HISTORY_CHUNK_SIZE,
+    max_buffer_mb: int = MAX_BUFFER_MB,
+    track_codes: Optional[dict[str, int]] = None,
+    user_codes: Optional[dict[str, int]] = None,
+    matrix: Optional[csr_matrix] = None
+) -> tuple[csr_matrix, dict[str, int], dict[str, int]]:
+    """
+    Build the track x user playcount matrix in a single chunked pass over the history.
+
+    Track and user codes are assigned incrementally in order of first appearance.
+    Events are buffered as COO blocks and summed into the running CSR matrix
+    whenever the buffer reaches `max_buffer_mb`, so memory is bounded by the
+    buffer, the id mappings and the compressed output rather than the raw history.
+    Existing codes and a matrix can be passed in to continue from a previous build.
+    """
+    track_codes = {} if track_codes is None else track_codes
+    user_codes = {} if user_codes is None else user_codes
+    if matrix is None:
+        matrix = csr_matrix((len(track_codes), len(user_codes)), dtype=np.float64)
 
-    history = history.assign(user_idx=user_codes, track_idx=track_codes)
-    grouped = history.groupby(['track_idx', 'user_idx'])['playcount'].sum().reset_index().compute()
+    max_buffered = max(1, max_buffer_mb * 2**20 // BYTES_PER_EVENT)
+    rows: list[np.ndarray] = []
+    cols: list[np.ndarray] = []
+    values: list[np.ndarray] = []
+    buffered = 0
 
-    matrix = csr_matrix(
-        (grouped['playcount'], (grouped['track_idx'], grouped['user_idx']))
+    reader = pd.read_csv(
+        history_path,
+        usecols=["track_id", "user_id", "playcount"],
+        dtype={"track_id": str, "user_id": str, "playcount": np.float64},
+        chunksize=min(chunksize, max_buffered),
     )
+    for chunk in reader:
+        rows.append(assign_codes(chunk["track_id"], track_codes))
+        cols.append(assign_codes(chunk["user_id"], user_codes))
+        values.append(chunk["playcount"].to_numpy())
+        buffered += len(chunk)
+
+        if buffered >= max_buffered:
+            matrix = merge_coo_block(matrix, rows, cols, values, (len(track_codes), len(user_codes)))
+            rows, cols, values, buffered = [], [], [], 0
+
+    if rows:
+        matrix = merge_coo_block(matrix, rows, cols, values, (len(track_codes), len(user_codes)))
+    matrix.resize((len(track_codes), len(user_codes)))
+    return matrix, track_codes, user_codes
+
+
+def build_interaction_data(
+    history_path: str,
+    songs: pd.DataFrame,
+    track_ids_path: str,
+    filtered_save_path: str,
+    matrix_save_path: str,
+    normalized_save_path: Optional[str] = None,
+    chunksize: int = HISTORY_CHUNK_SIZE,
+    max_buffer_mb: int = MAX_BUFFER_MB,
+    user_ids_path: Optional[str] = None,
+    alignment_path: Optional[str] = None
+) -> tuple[csr_matrix, np.ndarray, pd.DataFrame]:
+    """
+    Stream the listening history once and save the interaction matrix, the track IDs
+    (one per matrix row) and the songs filtered to the tracks in the history.
+    When `user_ids_path` is given the user IDs (one per matrix column) are saved too,
+    which `ingest_listening_delta` needs to keep the codes stable. When
+    `alignment_path` is given the track alignment (see `save_track_alignment`) is saved.
+    """
+    matrix, track_codes, user_codes = stream_interaction_matrix(history_path, chunksize, max_buffer_mb)
+    track_ids = np.array(list(track_codes), dtype=object)
+
+    np.save(track_ids_path, track_ids, allow_pickle=True)
+    if user_ids_path is not None:
+        np.save(user_ids_path, np.array(list(user_codes), dtype=object), allow_pickle=True)
     save_sparse_matrix(matrix, matrix_save_path)
-    return matrix
+    if normalized_save_path is not None:
+        save_sparse_matrix(normalize_interaction_matrix(matrix), normalized_save_path)
+    if alignment_path is not None:
+        save_track_alignment(track_ids, songs, alignment_path)
+    filtered = filter_songs(songs, track_ids, filtered_save_path)
+    return matrix, track_ids, filtered
+
+
+def append_to_history(delta_path: str, history_path: str, chunksize: int = HISTORY_CHUNK_SIZE) -> None:
+    """Append the delta events to the listening history CSV, in the history's column order."""
+    columns = pd.read_csv(history_path, nrows=0).columns.tolist()
+    with open(history_path, "rb+") as history:
+        history.seek(0, 2)
+        if history.tell() > 0:
+            history.seek(-1, 2)
+            if history.read(1) != b"\n":
+                history.write(b"\n")
+
+    for chunk in pd.read_csv(delta_path, usecols=columns, dtype=str, chunksize=chunksize):
+        chunk[columns].to_csv(history_path, mode="a", header=False, index=False)
+
+
+def ingest_listening_delta(
+    delta_path: str,
+    songs: pd.DataFrame,
+    track_ids_path: str,
+    user_ids_path: str,
+    filtered_path: str,
+    matrix_path: str,
+    normalized_path: Optional[str] = None,
+    chunksize: int = HISTORY_CHUNK_SIZE,
+    max_buffer_mb: int = MAX_BUFFER_MB,
+    alignment_path: Optional[str] = None,
+    history_path: Optional[str] = None
+) -> tuple[csr_matrix, np.ndarray, pd.DataFrame]:
+    """
+    Add new listening events to an existing build without re-reading the full history.
+
+    Existing track/user codes are kept. Unseen tracks and users are appended as
+    new matrix rows and columns, the delta playcounts are summed into the saved
+    matrix, and the normalized copy, track_ids.npy, user_ids.npy, the filtered
+    song table and (with `alignment_path`) the track alignment are rewritten.
+    Reading and grouping cost is proportional to the delta. Rewriting the matrix
+    files still costs O(nnz) of the merged matrix.
+
+    With `history_path` the delta is also appended to the listening history
+    before any output is rewritten. Codes are assigned in order of first
+    appearance, so a full rebuild from the extended history gives the same
+    artifacts and the delta survives a later `dvc repro`.
+    """
+    track_ids = np.load(track_ids_path, allow_pickle=True)
+    user_ids = np.load(user_ids_path, allow_pickle=True)
+    track_codes = {track_id: code for code, track_id in enumerate(track_ids.tolist())}
+    user_codes = {user_id: code for code, user_id in enumerate(user_ids.tolist())}
+    n_known_tracks = len(track_codes)
+
+    matrix, track_codes, user_codes = stream_interaction_matrix(
+        delta_path,
+        chunksize,
+        max_buffer_mb,
+        track_codes=track_codes,
+        user_codes=user_codes,
+        matrix=load_npz(matrix_path).tocsr().astype(np.float64),
+    )
+    track_ids = np.array(list(track_codes), dtype=object)
+    if history_path is not None:
+        append_to_history(delta_path, history_path, chunksize)
+
+    np.save(track_ids_path, track_ids, allow_pickle=True)
+    np.save(user_ids_path, np.array(list(user_codes), dtype=object), allow_pickle=True)
+    save_sparse_matrix(matrix, matrix_path)
+    if normalized_path is not None:
+        save_sparse_matrix(normalize_interaction_matrix(matrix), normalized_path)
+    if alignment_path is not None:
+        save_track_alignment(track_ids, songs, alignment_path)
+
+    filtered = pd.read_csv(filtered_path)
+    new_songs = songs[songs["track_id"].isin(track_ids[n_known_tracks:])]
+    if not new_songs.empty:
+        filtered = (
+            pd.concat([filtered, new_songs], ignore_index=True)
+            .sort_values(by="track_id")
+            .reset_index(drop=True)
+        )
+        save_dataframe(filtered, filtered_path)
+    return matrix, track_ids, filtered
 
 
 def collaborative_recommendation(
@@ -59,29 +257,86 @@ def collaborative_recommendation(
     track_ids: np.ndarray,
     songs_df: pd.DataFrame,
     interaction_matrix: csr_matrix,
-    k: int = 5
+    k: int = 5,
+    song_lookup: Optional[Mapping[tuple[str, str], int]] = None,
+    track_lookup: Optional[Mapping[str, int]] = None,
+    normalized: bool = False,
+    song_rows: Optional[np.ndarray] = None,
+    neighbor_index: Optional[tuple[np.ndarray, np.ndarray]] = None
 ) -> pd.DataFrame:
-    """Recommend songs using collaborative filtering."""
+    """
+    Recommend songs using collaborative filtering.
+
+    `song_lookup` ((name, artist) -> songs_df row) and `track_lookup`
+    (track_id -> interaction matrix row) replace the column scans with O(1) lookups.
+    With `normalized=True` the interaction matrix is expected to be L2 row-normalized
+    (see `normalize_interaction_matrix`), so scoring is a single sparse product, and
+    `song_rows` (see `build_song_rows`) lets the results be taken from songs_df by position.
+    A precomputed `neighbor_index` (neighbor_index.build_neighbor_index over the
+    interaction matrix rows) is read instead of scoring when it holds k + 1 neighbours.
+    """
+    from instrumentation import stopwatch
+    from ranking import top_k_indices
+    from song_lookup import SongNotFound, find_song
+
+    watch = stopwatch("collaborative")
     song_name, artist_name = song_name.lower(), artist_name.lower()
-    match = songs_df[(songs_df["name"].str.lower() == song_name) &
-                     (songs_df["artist"].str.lower() == artist_name)]
+    if song_lookup is not None:
+        song_row = find_song(song_lookup, song_name, artist_name)
+        if song_row is None:
+            raise SongNotFound("No matching song found for recommendation.")
+        input_track_id = songs_df["track_id"].iat[song_row]
+    else:
+        match = songs_df[(songs_df["name"].str.lower() == song_name) &
+                         (songs_df["artist"].str.lower() == artist_name)]
 
-    if match.empty:
-        raise ValueError("No matching song found for recommendation.")
+        if match.empty:
+            raise SongNotFound("No matching song found for recommendation.")
 
-    input_track_id = match['track_id'].values[0]
-    index = np.where(track_ids == input_track_id)[0]
+        input_track_id = match['track_id'].values[0]
 
-    if len(index) == 0:
-        raise ValueError("Track ID not found in interaction matrix.")
+    if track_lookup is not None:
+        index = track_lookup.get(input_track_id)
+        if index is None:
+            raise SongNotFound("Track ID not found in interaction matrix.")
+    else:
+        index = np.where(track_ids == input_track_id)[0]
 
-    index = index[0]
-    input_vector = interaction_matrix[index]
-    similarity = cosine_similarity(input_vector, interaction_matrix).ravel()
+        if len(index) == 0:
+            raise SongNotFound("Track ID not found in interaction matrix.")
+
+        index = index[0]
+    watch.lap("lookup")
+
+    # tracks ingested after the table was built are not covered and are scored live
+    if (neighbor_index is not None and index < neighbor_index[0].shape[0]
+            and k + 1 <= neighbor_index[0].shape[1]):
+        top_indices = np.asarray(neighbor_index[0][index, :k + 1])
+        top_scores = np.asarray(neighbor_index[1][index, :k + 1])
+        watch.lap("neighbor_index")
+    else:
+        input_vector = interaction_matrix[index]
+        if normalized:
+            similarity = (interaction_matrix @ input_vector.T).toarray().ravel()
+        else:
+            similarity = cosine_similarity(input_vector, interaction_matrix).ravel()
+        watch.lap("similarity")
+
+        top_indices = top_k_indices(similarity, k + 1)
+        top_scores = similarity[top_indices]
+        watch.lap("ranking")
+
+    if song_rows is not None:
+        rows = song_rows[top_indices]
+        recommendations = (
+            songs_df.iloc[rows[rows >= 0]]
+            .drop(columns=["track_id"])
+            .reset_index(drop=True)
+        )
+        watch.lap("merge")
+        return recommendations
 
-    top_indices = np.argsort(similarity)[-k - 1:][::-1]
     top_track_ids = track_ids[top_indices]
-    top_scores = similarity[top_indices]
 
     scores_df = pd.DataFrame({"track_id": top_track_ids, "score": top_scores})
     recommendations = (
@@ -91,18 +346,104 @@ def collaborative_recommendation(
         .drop(columns=["track_id", "score"])
         .reset_index(drop=True)
     )
+    watch.lap("merge")
     return recommendations
 
 
-def main() -> None:
+def collaborative_recommendation_batch(
+    seeds: list[tuple[str, str]],
+    songs_df: pd.DataFrame,
+    interaction_matrix: csr_matrix,
+    song_lookup: Mapping[tuple[str, str], int],
+    track_lookup: Mapping[str, int],
+    song_rows: np.ndarray,
+    k: int = 5,
+    aggregate: bool = False,
+    normalized: bool = False
+) -> Union[dict[tuple[str, str], pd.DataFrame], pd.DataFrame]:
+    """
+    Recommend songs for many seed songs with one sparse matrix product.
+
+    Seeds that are not in songs_df or the interaction matrix are skipped. Returns
+    {(name, artist): DataFrame} with the top k songs per seed, or with
+    `aggregate=True` one playlist-continuation DataFrame ranked by the mean
+    similarity to all seeds, excluding the seeds themselves.
+    """
+    from ranking import aggregate_top_k, top_k_indices
+    from song_lookup import SongNotFound, find_seed_tracks
+
+    keys, matrix_rows = find_seed_tracks(song_lookup, track_lookup, songs_df, seeds)
+
+    if not matrix_rows:
+        raise SongNotFound("No matching seed songs found for recommendation.")
+
+    seed_vectors = interaction_matrix[matrix_rows]
+    if normalized:
+        similarity = (seed_vectors @ interaction_matrix.T).toarray()
+    else:
+        similarity = cosine_similarity(seed_vectors, interaction_matrix)
+
+    def to_frame(top_indices: np.ndarray) -> pd.DataFrame:
+        rows = song_rows[top_indices]
+        return songs_df.iloc[rows[rows >= 0]].drop(columns=["track_id"]).reset_index(drop=True)
+
+    if aggregate:
+        return to_frame(aggregate_top_k(similarity, np.asarray(matrix_rows), k))
+
+    top_indices = top_k_indices(similarity, k + 1)
+    return {key: to_frame(indices) for key, indices in zip(keys, top_indices)}
+
+
+def main(argv: Optional[list[str]] = None) -> None:
     """Main execution function."""
-    user_history = dd.read_csv(USER_HISTORY_PATH)
-    unique_ids = user_history["track_id"].unique().compute().tolist()
+    parser = argparse.ArgumentParser(description="Build the collaborative filtering artifacts.")
+    parser.add_argument(
+        "--delta",
+        help="CSV of new listening events (same columns as the history) to merge into the existing "
+             "build and append to the history",
+    )
+    parser.add_argument(
+        "--max-buffer-mb",
+        type=int,
+        default=MAX_BUFFER_MB,
+        help="memory for buffered listening events before they are merged into the matrix",
+    )
+    args = parser.parse_args(argv)
 
     songs_df = pd.read_csv(SONGS_DATA_PATH)
-    filtered_songs = filter_songs(songs_df, unique_ids, FILTERED_DATA_SAVE_PATH)
+    if args.delta:
+        ingest_listening_delta(
+            args.delta,
+            songs_df,
+            TRACK_IDS_SAVE_PATH,
+            USER_IDS_SAVE_PATH,
+            FILTERED_DATA_SAVE_PATH,
+            INTERACTION_MATRIX_SAVE_PATH,
+            NORMALIZED_MATRIX_SAVE_PATH,
+            max_buffer_mb=args.max_buffer_mb,
+            alignment_path=TRACK_ALIGNMENT_SAVE_PATH,
+            history_path=USER_HISTORY_PATH,
+        )
+        # the interaction_data outputs now match the extended history; record them
+        # so DVC does not rebuild them, then refresh the stale downstream stages
+        print(
+            f"Merged {args.delta} into the interaction data and appended it to {USER_HISTORY_PATH}.\n"
+            "Run `dvc commit interaction_data` and then `dvc repro` to refresh the "
+            "collaborative neighbours, ALS factors, user mixes and bundle."
+        )
+        return
 
-    create_interaction_matrix(user_history, TRACK_IDS_SAVE_PATH, INTERACTION_MATRIX_SAVE_PATH)
+    build_interaction_data(
+        USER_HISTORY_PATH,
+        songs_df,
+        TRACK_IDS_SAVE_PATH,
+        FILTERED_DATA_SAVE_PATH,
+        INTERACTION_MATRIX_SAVE_PATH,
+        NORMALIZED_MATRIX_SAVE_PATH,
+        max_buffer_mb=args.max_buffer_mb,
+        user_ids_path=USER_IDS_SAVE_PATH,
+        alignment_path=TRACK_ALIGNMENT_SAVE_PATH,
+    )
 
 
 if __name__ == "__main__":
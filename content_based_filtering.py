@@ -1,3 +1,9 @@
+import argparse
+import os
+import tempfile
+import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
 import joblib
@@ -6,11 +12,24 @@ from category_encoders.count import CountEncoder
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.compose import ColumnTransformer
 from sklearn.metrics.pairwise import cosine_similarity
-from data_cleaning import data_for_content_filtering
-from scipy.sparse import save_npz
+from data_cleaning import DATA_PATH, clean_data, data_for_content_filtering
+from scipy.sparse import csr_matrix, save_npz, load_npz, vstack
+# the recommenders import their lookup, ranking and timing helpers themselves, and
+# append_catalog the neighbour index and vector store code, so the transform_data
+# stage only depends on the modules it actually runs
 
 # Cleaned Data Path
 CLEANED_DATA_PATH = "data/cleaned_data.csv"
+TRANSFORMED_DATA_PATH = "data/transformed_data.npz"
+TRANSFORMER_PATH = "transformer.joblib"
+NEIGHBOR_INDEX_PATH = "data/content_neighbors.npz"
+VECTOR_STORE_DIR = "data/content_vectors"
+
+# increase over the training data's own drift shares above which a full refit is recommended
+DRIFT_THRESHOLD = 0.2
+
+# rows per block in the chunked transform
+TRANSFORM_CHUNK_SIZE = 50_000
 
 # cols to transform
 frequency_enode_cols = ['year']
@@ -20,7 +39,7 @@ standard_scale_cols = ["duration_ms","loudness","tempo"]
 min_max_scale_cols = ["danceability","energy","speechiness","acousticness","instrumentalness","liveness","valence"]
 
 
-def train_transformer(data):
+def train_transformer(data, n_jobs=-1):
     """
     Trains a ColumnTransformer on the provided data and saves the transformer to a file.
     The ColumnTransformer applies the following transformations:
@@ -29,12 +48,16 @@ def train_transformer(data):
     - TF-IDF Vectorization using TfidfVectorizer on a specified column.
     - Standard Scaling using StandardScaler on specified columns.
     - Min-Max Scaling using MinMaxScaler on specified columns.
+    The branches are independent and are fitted in parallel. The saved transformer
+    is reset to n_jobs=1, since transforms are parallelized over row blocks instead.
     Parameters:
     data (pd.DataFrame): The input data to be transformed.
+    n_jobs (int, optional): Processes used to fit the branches (-1 for all cores). Default is -1.
     Returns:
     None
     Saves:
-    transformer.joblib: The trained ColumnTransformer object.
+    transformer.joblib: The trained ColumnTransformer object, with the drift
+    shares of the training data as `drift_baseline_` (see measure_drift).
     """
     # transformer 
     transformer = ColumnTransformer(transformers=[
@@ -43,13 +66,16 @@ def train_transformer(data):
         ("tfidf", TfidfVectorizer(max_features=85), tfidf_col),
         ("standard_scale", StandardScaler(), standard_scale_cols),
         ("min_max_scale", MinMaxScaler(), min_max_scale_cols)
-    ],remainder='passthrough',n_jobs=1,force_int_remainder_cols=False)
+    ],remainder='passthrough',n_jobs=n_jobs,force_int_remainder_cols=False)
 
     # fit the transformer
     transformer.fit(data)
+    transformer.set_params(n_jobs=1)
+    # the training data's own unseen / out-of-vocabulary shares, which appends are compared against
+    transformer.drift_baseline_ = measure_drift(transformer, data)
 
     # save the transformer
-    joblib.dump(transformer, "transformer.joblib")
+    joblib.dump(transformer, TRANSFORMER_PATH)
     
 
 def transform_data(data):
@@ -61,7 +87,7 @@ def transform_data(data):
         array-like: The transformed data.
     """
     # load the transformer
-    transformer = joblib.load("transformer.joblib")
+    transformer = joblib.load(TRANSFORMER_PATH)
     
     # transform the data
     transformed_data = transformer.transform(data)
@@ -69,6 +95,100 @@ def transform_data(data):
     return transformed_data
 
 
+_worker_transformer = None
+
+
+def _load_worker_transformer(transformer_path):
+    """Load the fitted transformer once per worker process."""
+    global _worker_transformer
+    _worker_transformer = joblib.load(transformer_path)
+
+
+def _transform_chunk(chunk):
+    """Transform one block of cleaned rows in a worker process."""
+    return csr_matrix(_worker_transformer.transform(data_for_content_filtering(chunk)))
+
+
+def transform_data_chunked(data_path=CLEANED_DATA_PATH, save_path=TRANSFORMED_DATA_PATH,
+                           transformer_path=TRANSFORMER_PATH, chunksize=TRANSFORM_CHUNK_SIZE, n_workers=None):
+    """
+    Transform the cleaned catalog in row blocks on a process pool and save the result.
+
+    The CSV is read `chunksize` rows at a time and at most two blocks per worker are
+    in flight. Each worker loads the fitted transformer once. The sparse blocks are
+    written in order to raw files next to the output and the NPZ is written from
+    memory maps of them, so neither the catalog nor the whole matrix is held in memory.
+    The result is identical to transform_data on the full DataFrame.
+
+    Parameters:
+    data_path (str, optional): The cleaned data CSV. Default is CLEANED_DATA_PATH.
+    save_path (str, optional): The transformed data NPZ to write. Default is TRANSFORMED_DATA_PATH.
+    transformer_path (str, optional): The fitted transformer. Default is TRANSFORMER_PATH.
+    chunksize (int, optional): Rows per block. Default is TRANSFORM_CHUNK_SIZE.
+    n_workers (int, optional): Worker processes. Default is the number of cores.
+
+    Returns:
+    tuple: The (n_rows, n_columns) shape of the saved matrix.
+    """
+    n_workers = n_workers or os.cpu_count()
+    indptr = [np.zeros(1, dtype=np.int64)]
+    n_columns = len(joblib.load(transformer_path).get_feature_names_out())
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(save_path) or ".") as temp_dir:
+        data_file_path = os.path.join(temp_dir, "data.bin")
+        indices_file_path = os.path.join(temp_dir, "indices.bin")
+
+        with open(data_file_path, "wb") as data_file, open(indices_file_path, "wb") as indices_file:
+            def write_block(block):
+                block.sort_indices()
+                block.data.astype(np.float64).tofile(data_file)
+                block.indices.astype(np.int32).tofile(indices_file)
+                indptr.append(indptr[-1][-1] + block.indptr[1:].astype(np.int64))
+
+            with ProcessPoolExecutor(n_workers, initializer=_load_worker_transformer,
+                                     initargs=(transformer_path,)) as executor:
+                pending = deque()
+                for chunk in pd.read_csv(data_path, chunksize=chunksize):
+                    pending.append(executor.submit(_transform_chunk, chunk))
+                    if len(pending) >= 2 * n_workers:
+                        write_block(pending.popleft().result())
+                while pending:
+                    write_block(pending.popleft().result())
+
+        indptr = np.concatenate(indptr)
+        nnz = int(indptr[-1])
+        if nnz:
+            data = np.memmap(data_file_path, dtype=np.float64, mode="r", shape=(nnz,))
+            indices = np.memmap(indices_file_path, dtype=np.int32, mode="r", shape=(nnz,))
+        else:
+            data, indices = np.empty(0, dtype=np.float64), np.empty(0, dtype=np.int32)
+        shape = (len(indptr) - 1, n_columns)
+        save_transformed_data(csr_matrix((data, indices, indptr), shape=shape, copy=False), save_path)
+        del data, indices
+
+    return shape
+
+
+def build_transformed_data(data_path=CLEANED_DATA_PATH, chunksize=TRANSFORM_CHUNK_SIZE, n_jobs=-1):
+    """
+    Fit the transformer and transform the catalog with transform_data_chunked.
+
+    Only the content columns are read for fitting.
+
+    Parameters:
+    data_path (str, optional): The cleaned data CSV. Default is CLEANED_DATA_PATH.
+    chunksize (int, optional): Rows per block in the transform. Default is TRANSFORM_CHUNK_SIZE.
+    n_jobs (int, optional): Processes for fitting and transforming (-1 for all cores). Default is -1.
+
+    Returns:
+    tuple: The (n_rows, n_columns) shape of the saved matrix.
+    """
+    content_columns = data_for_content_filtering(pd.read_csv(data_path, nrows=0)).columns
+    train_transformer(pd.read_csv(data_path, usecols=content_columns)[content_columns], n_jobs)
+    n_workers = None if n_jobs == -1 else n_jobs
+    return transform_data_chunked(data_path, chunksize=chunksize, n_workers=n_workers)
+
+
 def save_transformed_data(transformed_data,save_path):
     """
     Save the transformed data to a specified file path.
@@ -99,38 +219,236 @@ def calculate_similarity_scores(input_vector, data):
     return similarity_scores
 
 
-def content_recommendation(song_name, songs_data, transformed_data, k=10):
+def content_recommendation(song_name, songs_data, transformed_data, k=10, neighbor_index=None,
+                           artist_name=None, song_lookup=None, vector_store=None, use_quantized=False):
     """
     Recommends top k songs similar to the given song based on content-based filtering.
 
+    When a precomputed neighbour index is given and holds enough neighbours for k,
+    the recommendations are read straight from it; otherwise the similarity scores
+    are computed live against the whole catalog, from the vector store if one is
+    given and from transformed_data otherwise.
+
     Parameters:
     song_name (str): The name of the song to base the recommendations on.
     songs_data (DataFrame): The DataFrame containing song information.
     transformed_data (ndarray): The transformed data matrix for similarity calculations.
     k (int, optional): The number of similar songs to recommend. Default is 10.
+    neighbor_index (tuple, optional): (indices, scores) from neighbor_index.build_neighbor_index.
+    artist_name (str, optional): The artist of the song, used together with song_lookup.
+    song_lookup (Mapping, optional): (name, artist) -> row lookup from song_lookup.build_song_lookup.
+    When given with artist_name the song is found in O(1) instead of scanning the name column.
+    vector_store (VectorStore, optional): float32 dense/sparse vectors from vector_store.build_vector_store,
+    used for live scoring instead of transformed_data when given.
+    use_quantized (bool, optional): Score with the int8 copy in the vector store first and re-rank
+    the candidates exactly. Default is False.
 
     Returns:
     DataFrame: A DataFrame containing the top k recommended songs with their names, artists, and Spotify preview URLs.
     """
+    from instrumentation import stopwatch
+    from song_lookup import SongNotFound, find_song
+
+    watch = stopwatch("content")
     song_name = song_name.lower()
-    
-    song_row = songs_data.loc[songs_data["name"].str.lower() == song_name]
-    
-    if song_row.empty:
-        raise ValueError(f"❌ Song '{song_name}' not found in the dataset.")
-    
-    song_index = song_row.index[0]
-    input_vector = transformed_data[song_index].reshape(1, -1)
-    
-    similarity_scores = calculate_similarity_scores(input_vector, transformed_data)
-    top_k_songs_indexes = np.argsort(similarity_scores.ravel())[-k-1:][::-1]
+
+    if song_lookup is not None and artist_name is not None:
+        song_index = find_song(song_lookup, song_name, artist_name)
+        if song_index is None:
+            raise SongNotFound(f"❌ Song '{song_name}' not found in the dataset.")
+    else:
+        song_row = songs_data.loc[songs_data["name"].str.lower() == song_name]
+
+        if song_row.empty:
+            raise SongNotFound(f"❌ Song '{song_name}' not found in the dataset.")
+
+        song_index = song_row.index[0]
+    watch.lap("lookup")
+
+    if neighbor_index is not None and k + 1 <= neighbor_index[0].shape[1]:
+        top_k_songs_indexes = neighbor_index[0][song_index, :k + 1]
+        watch.lap("neighbor_index")
+    elif vector_store is not None:
+        top_k_songs_indexes = vector_store.top_k(song_index, k + 1, use_quantized)
+        watch.lap("vector_store")
+    else:
+        input_vector = transformed_data[song_index].reshape(1, -1)
+        similarity_scores = calculate_similarity_scores(input_vector, transformed_data)
+        watch.lap("similarity")
+        top_k_songs_indexes = np.argsort(similarity_scores.ravel())[-k-1:][::-1]
+        watch.lap("ranking")
     
     top_k_songs_names = songs_data.iloc[top_k_songs_indexes]
     top_k_list = top_k_songs_names[['name', 'artist', 'spotify_preview_url']].reset_index(drop=True)
+    watch.lap("result")
     
     return top_k_list
 
 
+def content_recommendation_batch(seeds, songs_data, transformed_data, song_lookup, k=10, aggregate=False,
+                                 vector_store=None, use_quantized=False):
+    """
+    Recommends songs for many seed songs with a single similarity computation.
+
+    All seeds are scored against the catalog in one matrix product, so a
+    playlist of seeds costs one pass instead of one pass per seed.
+
+    Parameters:
+    seeds (list): (song_name, artist_name) pairs. Seeds not in the dataset are skipped.
+    songs_data (DataFrame): The DataFrame containing song information.
+    transformed_data (ndarray): The transformed data matrix for similarity calculations.
+    song_lookup (Mapping): (name, artist) -> row lookup from song_lookup.build_song_lookup.
+    k (int, optional): The number of similar songs to recommend. Default is 10.
+    aggregate (bool, optional): Return one playlist-continuation list of k songs
+    ranked by the mean similarity to all seeds, excluding the seeds. Default is False.
+    vector_store (VectorStore, optional): float32 dense/sparse vectors scored instead of transformed_data.
+    use_quantized (bool, optional): Select candidates with the int8 copy in the vector store and
+    re-rank them exactly. Default is False.
+
+    Returns:
+    dict or DataFrame: {(name, artist): DataFrame} with the top k songs per seed (as
+    returned by content_recommendation), or a single DataFrame when aggregate is True.
+    """
+    from ranking import aggregate_top_k, top_k_indices
+    from song_lookup import SongNotFound, find_songs
+
+    keys, seed_indexes = find_songs(song_lookup, seeds)
+    if len(seed_indexes) == 0:
+        raise SongNotFound("❌ None of the seed songs were found in the dataset.")
+    columns = ['name', 'artist', 'spotify_preview_url']
+
+    if vector_store is not None:
+        if aggregate:
+            top_indexes = vector_store.aggregate_top_k(seed_indexes, k, use_quantized)
+            return songs_data.iloc[top_indexes][columns].reset_index(drop=True)
+        top_indexes = vector_store.batch_top_k(seed_indexes, k + 1, use_quantized)
+    else:
+        similarity_scores = calculate_similarity_scores(transformed_data[seed_indexes], transformed_data)
+        if aggregate:
+            top_indexes = aggregate_top_k(similarity_scores, seed_indexes, k)
+            return songs_data.iloc[top_indexes][columns].reset_index(drop=True)
+        top_indexes = top_k_indices(similarity_scores, k + 1)
+
+    return {
+        key: songs_data.iloc[row_indexes][columns].reset_index(drop=True)
+        for key, row_indexes in zip(keys, top_indexes)
+    }
+
+
+def measure_drift(transformer, data):
+    """
+    Measure how much of the new data the fitted transformer cannot represent.
+
+    Parameters:
+    transformer (ColumnTransformer): The fitted transformer.
+    data (pd.DataFrame): New rows prepared with data_for_content_filtering.
+
+    Returns:
+    dict: The share of rows with an artist, key or time signature unseen by the
+    OneHotEncoder (which ignores them), the share of rows with a frequency-encoded
+    value unseen by the CountEncoder, and the share of tag tokens outside the
+    TF-IDF vocabulary. The training data itself has a non-zero out-of-vocabulary
+    share, since the vocabulary is truncated to max_features, so compare the
+    shares with the transformer's `drift_baseline_` rather than with zero.
+    """
+    ohe = transformer.named_transformers_["ohe"]
+    drift = {
+        f"unseen_{column}": float((~data[column].isin(categories)).mean())
+        for column, categories in zip(ohe_cols, ohe.categories_)
+    }
+
+    # CountEncoder only builds a mapping for the columns it treated as categorical
+    count_mapping = transformer.named_transformers_["frequency_encode"].mapping or {}
+    for column in frequency_enode_cols:
+        if column in count_mapping:
+            drift[f"unseen_{column}"] = float((~data[column].isin(count_mapping[column].index)).mean())
+
+    tfidf = transformer.named_transformers_["tfidf"]
+    tokenize = tfidf.build_analyzer()
+    tokens = [token for tags in data[tfidf_col].astype(str) for token in tokenize(tags)]
+    unknown = sum(token not in tfidf.vocabulary_ for token in tokens)
+    drift["tags_out_of_vocabulary"] = unknown / len(tokens) if tokens else 0.0
+    return drift
+
+
+def append_catalog(new_data, songs_path=CLEANED_DATA_PATH, transformed_path=TRANSFORMED_DATA_PATH,
+                   transformer_path=TRANSFORMER_PATH, neighbor_path=NEIGHBOR_INDEX_PATH,
+                   drift_threshold=DRIFT_THRESHOLD, vector_store_dir=VECTOR_STORE_DIR,
+                   raw_data=None, raw_path=DATA_PATH):
+    """
+    Append new songs to the catalog without refitting the transformer.
+
+    Only the new rows are transformed with the persisted transformer. They are
+    appended to the cleaned data and to the stored vectors, and the neighbour
+    index and the vector store are extended if they exist. A drift report says whether the new rows
+    differ enough from the training data that a full refit is recommended: a
+    share is flagged when it exceeds the training data's own share (saved at
+    fit time) by more than `drift_threshold`.
+
+    When `raw_data` is given, its rows for the appended songs are also appended
+    to the raw metadata, so the songs survive a later `dvc repro` of data_cleaning.
+
+    Parameters:
+    new_data (pd.DataFrame): New cleaned song rows (same columns as the cleaned data).
+    songs_path (str, optional): The cleaned data CSV to append to.
+    transformed_path (str, optional): The transformed data NPZ to append to.
+    transformer_path (str, optional): The fitted transformer.
+    neighbor_path (str, optional): The neighbour index to extend, skipped when missing.
+    drift_threshold (float, optional): Drift share above which a refit is flagged.
+    vector_store_dir (str, optional): The vector store to extend, skipped when missing.
+    raw_data (pd.DataFrame, optional): The raw rows new_data was cleaned from.
+    raw_path (str, optional): The raw metadata CSV to append them to. Default is DATA_PATH.
+
+    Returns:
+    dict: The drift report with the number of appended rows and a "needs_refit" flag.
+    """
+    from neighbor_index import extend_neighbor_index, load_neighbor_index, save_neighbor_index
+    from vector_store import extend_vector_store, load_vector_store, save_vector_store
+
+    songs_data = pd.read_csv(songs_path)
+    new_data = new_data[~new_data["track_id"].isin(songs_data["track_id"])]
+    new_data = new_data.drop_duplicates(subset="track_id")[songs_data.columns]
+    if new_data.empty:
+        return {"appended": 0, "needs_refit": False}
+
+    transformer = joblib.load(transformer_path)
+    content_data = data_for_content_filtering(new_data)
+    report = measure_drift(transformer, content_data)
+    baseline = getattr(transformer, "drift_baseline_", None)
+    if baseline is None:
+        # transformers fitted before the baseline was saved: measure the current catalog
+        baseline = measure_drift(transformer, data_for_content_filtering(songs_data))
+    report["needs_refit"] = any(
+        share - baseline.get(name, 0.0) > drift_threshold for name, share in report.items()
+    )
+    report["appended"] = len(new_data)
+
+    if raw_data is not None:
+        raw_columns = pd.read_csv(raw_path, nrows=0).columns
+        raw_rows = raw_data[raw_data["track_id"].isin(new_data["track_id"])].drop_duplicates(subset="track_id")
+        raw_rows[raw_columns].to_csv(raw_path, mode="a", header=False, index=False)
+
+    new_vectors = transformer.transform(content_data)
+    transformed_data = vstack([load_npz(transformed_path), new_vectors]).tocsr()
+    save_transformed_data(transformed_data, transformed_path)
+    new_data.to_csv(songs_path, mode="a", header=False, index=False)
+
+    if neighbor_path is not None and os.path.exists(neighbor_path):
+        indices, scores = load_neighbor_index(neighbor_path)
+        indices, scores = extend_neighbor_index(indices, scores, transformed_data)
+        save_neighbor_index(indices, scores, neighbor_path)
+
+    if vector_store_dir is not None and os.path.isdir(vector_store_dir):
+        store = extend_vector_store(load_vector_store(vector_store_dir), new_vectors)
+        save_vector_store(store, vector_store_dir)
+
+    if report["needs_refit"]:
+        warnings.warn(
+            f"Appended songs drift from the fitted transformer ({report}); rerun the transform_data stage to refit."
+        )
+    return report
+
+
 def test_recommendations(data_path, song_name, k=10):
     """
     Test the recommendations for a given song using content-based filtering.
@@ -172,4 +490,23 @@ def test_recommendations(data_path, song_name, k=10):
     print(top_k_songs)
     
 if __name__ == "__main__":
-    test_recommendations(CLEANED_DATA_PATH, "Hips Don't Lie")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Fit and apply the content-based filtering transformer.")
+    parser.add_argument("--append", help="CSV of new songs in Music_Info.csv format to append without refitting")
+    parser.add_argument("--chunked", action="store_true",
+                        help="fit in parallel and transform the catalog in row blocks on a process pool")
+    parser.add_argument("--chunk-size", type=int, default=TRANSFORM_CHUNK_SIZE, help="rows per block")
+    parser.add_argument("--jobs", type=int, default=-1, help="worker processes (-1 for all cores)")
+    args = parser.parse_args()
+
+    if args.append:
+        raw_data = pd.read_csv(args.append)
+        print(append_catalog(clean_data(raw_data), raw_data=raw_data))
+        # the content outputs now include the new songs; record them so DVC does not rebuild them
+        print(
+            f"Appended the new songs to {DATA_PATH}. Run `dvc commit data_cleaning transform_data "
+            "content_neighbors vector_store` and then `dvc repro` to refresh the interaction data and bundle."
+        )
+    elif args.chunked:
+        print(build_transformed_data(CLEANED_DATA_PATH, args.chunk_size, args.jobs))
+    else:
+        test_recommendations(CLEANED_DATA_PATH, "Hips Don't Lie")
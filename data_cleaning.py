@@ -1,7 +1,40 @@
+import argparse
+import numpy as np
 import pandas as pd
 
 
 DATA_PATH = 'data/Music_Info.csv'
+CLEANED_DATA_PATH = 'data/cleaned_data.csv'
+
+# rows read per chunk by the streaming cleaner
+CHUNK_SIZE = 100_000
+
+# explicit dtypes for Music_Info.csv so every chunk parses the same way
+MUSIC_INFO_DTYPES = {
+    'track_id': 'str',
+    'name': 'str',
+    'artist': 'category',
+    'spotify_preview_url': 'str',
+    'spotify_id': 'str',
+    'tags': 'str',
+    'genre': 'str',
+    'year': 'int64',
+    'duration_ms': 'int64',
+    'danceability': 'float64',
+    'energy': 'float64',
+    'key': 'int64',
+    'loudness': 'float64',
+    'mode': 'int64',
+    'speechiness': 'float64',
+    'acousticness': 'float64',
+    'instrumentalness': 'float64',
+    'liveness': 'float64',
+    'valence': 'float64',
+    'tempo': 'float64',
+    'time_signature': 'int64',
+}
+# low-cardinality integer columns kept as categoricals while cleaning
+CATEGORICAL_INT_COLS = ['key', 'time_signature']
 
 def clean_data(df):
     """
@@ -31,6 +64,118 @@ def clean_data(df):
     )
 
 
+def lower_categorical(values):
+    """
+    Lowercase a categorical Series by lowercasing its categories only.
+
+    Parameters:
+    values (pd.Series): A categorical Series of strings.
+
+    Returns:
+    pd.Series: A categorical Series with lowercase values (categories that
+    collapse to the same lowercase string are merged).
+    """
+    codes, categories = pd.factorize(values.cat.categories.str.lower())
+    # the extra -1 keeps missing values (code -1) missing
+    codes = np.append(codes, -1)
+    return pd.Series(
+        pd.Categorical.from_codes(codes[values.cat.codes.to_numpy()], categories),
+        index=values.index,
+        name=values.name,
+    )
+
+
+def first_occurrences(values, seen):
+    """
+    Flag the values not seen before, in this chunk or in previous ones.
+
+    Parameters:
+    values (pd.Series): The values to check.
+    seen (set): Values of previous chunks; updated in place.
+
+    Returns:
+    np.ndarray: Boolean mask of the rows to keep.
+    """
+    # all missing values count as one value, like drop_duplicates
+    keys = values.astype(object).where(values.notna(), None).tolist()
+    keep = np.empty(len(keys), dtype=bool)
+    for position, key in enumerate(keys):
+        keep[position] = key not in seen
+        seen.add(key)
+    return keep
+
+
+def clean_chunk(chunk, seen_ids):
+    """
+    Clean one chunk of Music_Info.csv the same way as clean_data.
+
+    Parameters:
+    chunk (pd.DataFrame): Raw rows read with MUSIC_INFO_DTYPES.
+    seen_ids (set): spotify_ids of the previous chunks; updated in place.
+
+    Returns:
+    pd.DataFrame: The cleaned rows, with categorical artist, key and time_signature.
+    """
+    chunk = chunk.loc[first_occurrences(chunk['spotify_id'], seen_ids)]
+    chunk = chunk.drop(columns=['spotify_id', 'genre']).fillna({'tags': 'no_tags'})
+    return chunk.assign(
+        name=chunk['name'].str.lower(),
+        artist=lower_categorical(chunk['artist']),
+        tags=chunk['tags'].str.lower(),
+        **{column: chunk[column].astype('category') for column in CATEGORICAL_INT_COLS}
+    )
+
+
+def clean_data_chunked(data_path, save_path, chunksize=CHUNK_SIZE):
+    """
+    Stream Music_Info.csv through clean_data in chunks with bounded memory.
+
+    Chunks are read with explicit dtypes, spotify_ids are deduplicated across
+    chunks with a hash set, and each cleaned chunk is written as soon as it is
+    ready: appended to a CSV, or as one row group of a Parquet file when
+    save_path ends in ".parquet" (requires pyarrow). The CSV is identical to
+    clean_data(pd.read_csv(data_path)).to_csv(save_path, index=False).
+
+    Parameters:
+    data_path (str): The file path to the raw data CSV file.
+    save_path (str): The file path of the cleaned output (.csv or .parquet).
+    chunksize (int, optional): Rows read per chunk. Default is CHUNK_SIZE.
+
+    Returns:
+    int: The number of cleaned rows written.
+    """
+    seen_ids = set()
+    n_rows = 0
+    writer = None
+    schema = None
+    parquet = save_path.endswith('.parquet')
+
+    try:
+        for chunk in pd.read_csv(data_path, dtype=MUSIC_INFO_DTYPES, chunksize=chunksize):
+            cleaned = clean_chunk(chunk, seen_ids)
+            if parquet:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+
+                table = pa.Table.from_pandas(cleaned, preserve_index=False)
+                if writer is None:
+                    # categories differ between chunks, so store plain values and let
+                    # Parquet dictionary-encode them per row group
+                    schema = pa.schema([
+                        field.with_type(field.type.value_type) if pa.types.is_dictionary(field.type) else field
+                        for field in table.schema
+                    ])
+                    writer = pq.ParquetWriter(save_path, schema)
+                writer.write_table(table.cast(schema))
+            else:
+                cleaned.to_csv(save_path, mode='w' if n_rows == 0 else 'a', header=n_rows == 0, index=False)
+            n_rows += len(cleaned)
+    finally:
+        if writer is not None:
+            writer.close()
+    return n_rows
+
+
 def data_for_content_filtering(data):
     """
     Cleans the input DataFrame by dropping specific columns.
@@ -51,23 +196,24 @@ def data_for_content_filtering(data):
     )
     
 
-def main(data_path):
+def main(data_path, save_path=CLEANED_DATA_PATH, chunksize=CHUNK_SIZE):
     """
     Main function to load, clean, and save data.
+    The raw data is streamed in chunks, see clean_data_chunked.
     Parameters:
     data_path (str): The file path to the raw data CSV file.
+    save_path (str, optional): The cleaned output (.csv or .parquet). Default is CLEANED_DATA_PATH.
+    chunksize (int, optional): Rows read per chunk. Default is CHUNK_SIZE.
     Returns:
     None
     """
-    # load the data
-    data = pd.read_csv(data_path)
-    
-    # perform data cleaning
-    cleaned_data = clean_data(data)
-    
-    # saved cleaned data
-    cleaned_data.to_csv("data/cleaned_data.csv",index=False)
+    clean_data_chunked(data_path, save_path, chunksize)
     
 
 if __name__ == "__main__":
-    main(DATA_PATH)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Clean the raw song metadata.")
+    parser.add_argument("--output", default=CLEANED_DATA_PATH, help="cleaned output path (.csv or .parquet)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="rows read per chunk")
+    args = parser.parse_args()
+
+    main(DATA_PATH, args.output, args.chunk_size)
@@ -1,35 +1,374 @@
-from flask import Flask, render_template, request
-from scipy.sparse import load_npz
-import pandas as pd
-from content_based_filtering import recommend
+"""
+Flask recommendation service.
+
+Endpoints:
+    GET  /                  HTML search form (content-based filtering); a name with one
+                            exact match is recommended for, otherwise the suggestions are listed.
+    GET  /autocomplete      ?q=...&limit=10&mode=content|collaborative|als|hybrid
+                            prefix and typo-tolerant song suggestions with their row.
+    GET  /recommend         ?song=...&artist=...&k=10&mode=content|collaborative|als|hybrid
+                            (or ?row=... with a row returned by /autocomplete);
+                            hybrid mode takes &weight=0.5, the share of content similarity.
+    POST /recommend         the same fields as a JSON body.
+    POST /recommend/batch   {"seeds": [{"song": ..., "artist": ...}, ...], "k": 10,
+                             "mode": "content"|"collaborative"|"als"|"hybrid", "aggregate": false,
+                             "weight": 0.5}; a seed may also be a [song, artist] pair.
+    GET  /recommend/user    ?user=...&k=10&space=collaborative|content
+                            unplayed songs for a user of the listening history.
+    POST /recommend/users   {"users": [...], "k": 10, "space": "collaborative"|"content"}
+    GET  /metrics           per-mode, per-phase latency histograms
+                            (set RECOMMENDER_METRICS=0 to disable timing). The
+                            histograms are per worker unless RECOMMENDER_METRICS_DIR
+                            points every worker at a shared directory.
+
+Development server:
+    python flask_app.py
+
+Multi-worker run mode (the artifact bundle is memory mapped, so with --preload
+every worker shares the same pages instead of holding a private copy):
+    RECOMMENDER_METRICS_DIR=/tmp/recommender-metrics \
+        gunicorn --workers 4 --threads 4 --preload --bind 0.0.0.0:8000 flask_app:app
+
+`python artifacts.py` can run while the server is up: workers pick up the new
+bundle version within RECOMMENDER_RELOAD_CHECK_SECONDS (default 5).
+RECOMMENDER_CONTENT_SCORING=neighbors|float32|int8 picks how content mode scores
+(int8 scans the quantized vector store and re-ranks the candidates exactly).
+"""
+import math
+import os
+
+from flask import Flask, jsonify, render_template, request
+
+import instrumentation
+
+from collaborative_filtering import collaborative_recommendation_batch
+from content_based_filtering import content_recommendation_batch
+from hybrid_filtering import HYBRID_WEIGHT, hybrid_recommendation_batch
+from latent_factors import als_recommendation_batch
+from model_registry import (
+    ALS, CONTENT, HYBRID, MODES, USE_QUANTIZED, ResultCache, get_models, recommend, recommend_row, recommend_user,
+    register_cache, suggest
+)
+from user_recommendations import USER_SPACES, UserNotFound, user_recommendation_batch
+from song_lookup import SongNotFound, song_key
+
+# JSON result cache settings
+CACHE_SIZE = 4096
+CACHE_TTL_SECONDS = 300
+MAX_K = 100
+MAX_BATCH_SEEDS = 500
+MAX_SUGGESTIONS = 50
+MAX_BATCH_USERS = 500
+RESPONSE_COLUMNS = ["name", "artist", "spotify_preview_url"]
 
 app = Flask(__name__)
+result_cache = ResultCache(maxsize=CACHE_SIZE, ttl=CACHE_TTL_SECONDS)
+register_cache(result_cache)
+# the requested song, row or user is not known (404); any other error is a
+# server fault and is left to Flask's 500 handler
+LOOKUP_ERRORS = (SongNotFound, UserNotFound)
+
+# Load data once per process (memory-mapped from the artifact bundle)
+get_models()
+
+
+def to_records(recommendations):
+    """Convert a recommendations DataFrame into JSON-ready records."""
+    records = recommendations[RESPONSE_COLUMNS].to_dict("records")
+    for record in records:
+        for column, value in record.items():
+            if isinstance(value, float) and math.isnan(value):
+                record[column] = None
+    return records
+
+
+def cached_response(key):
+    """Return a cached response, after reloading the models (and clearing the cache) if the bundle changed."""
+    get_models()
+    return result_cache.get(key)
+
+
+def parse_k(value):
+    """Parse and bound the number of recommendations."""
+    k = int(value)
+    if not 1 <= k <= MAX_K:
+        raise ValueError(f"k must be between 1 and {MAX_K}.")
+    return k
+
+
+def parse_mode(value):
+    """Validate the filtering mode."""
+    if value not in MODES:
+        raise ValueError(f"mode must be one of {', '.join(MODES)}.")
+    return value
+
+
+def parse_weight(value):
+    """Parse and bound the hybrid content weight."""
+    weight = float(value)
+    if not 0.0 <= weight <= 1.0:
+        raise ValueError("weight must be between 0 and 1.")
+    return weight
+
+
+def parse_flag(name, value):
+    """Parse a boolean given as a JSON boolean or as true/false/1/0."""
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ("true", "1"):
+        return True
+    if text in ("false", "0"):
+        return False
+    raise ValueError(f"{name} must be true or false.")
+
+
+def parse_seed(seed):
+    """Parse a seed given as {"song": ..., "artist": ...} or as a [song, artist] pair."""
+    if isinstance(seed, dict):
+        song_name, artist_name = seed.get('song'), seed.get('artist')
+    elif isinstance(seed, (list, tuple)) and len(seed) == 2:
+        song_name, artist_name = seed
+    else:
+        raise ValueError("each seed must be {\"song\": ..., \"artist\": ...} or a [song, artist] pair.")
+    if not isinstance(song_name, str) or not isinstance(artist_name, str):
+        raise ValueError("seed song and artist must be strings.")
+    return song_key(song_name, artist_name)
 
-# Load data
-data = pd.read_csv("data/cleaned_data.csv")
-transformed_data = load_npz("data/transformed_data.npz")
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
     recommendations = None
+    suggestions = []
     song_name = ''
     k = 10
     error_message = ''
 
     if request.method == 'POST':
         song_name = request.form.get('song_name', '').strip()
+        row = request.form.get('row', '').strip()
         k = int(request.form.get('num_recs', 10))
         if not song_name:
             error_message = "Please enter a song name."
         else:
             try:
-                recommendations = recommend(song_name.lower(), data, transformed_data, k)
-                if recommendations.empty:
-                    error_message = "No matching song found. Please check your spelling."
+                if row:
+                    # a song picked from the suggestions names its row directly
+                    recommendations = to_records(recommend_row(int(row), k))
+                else:
+                    # recommend only for an unambiguous exact name; otherwise let the user pick
+                    suggestions = suggest(song_name)
+                    query = song_key(song_name, '')[0]
+                    exact = [suggestion for suggestion in suggestions if suggestion[0] == query]
+                    if len(exact) == 1:
+                        song_name, _, row = exact[0]
+                        recommendations = to_records(recommend_row(row, k))
+                        suggestions = []
+                    elif not suggestions:
+                        error_message = "No matching song found. Please check your spelling."
             except Exception as e:
                 error_message = str(e)
 
-    return render_template("index.html", song_name=song_name, recommendations=recommendations, error=error_message)
+    return render_template(
+        "index.html", song_name=song_name, k=k, recommendations=recommendations,
+        suggestions=suggestions, error=error_message
+    )
+
+
+@app.route('/autocomplete', methods=['GET'])
+def autocomplete():
+    query = request.args.get('q', '')
+    try:
+        limit = int(request.args.get('limit', 10))
+        if not 1 <= limit <= MAX_SUGGESTIONS:
+            raise ValueError(f"limit must be between 1 and {MAX_SUGGESTIONS}.")
+        mode = parse_mode(request.args.get('mode', CONTENT))
+    except (TypeError, ValueError) as e:
+        return jsonify(error=str(e)), 400
+
+    suggestions = [
+        {"song": name, "artist": artist, "row": row}
+        for name, artist, row in suggest(query, limit, mode)
+    ]
+    return jsonify(query=query, mode=mode, suggestions=suggestions)
+
+
+@app.route('/recommend', methods=['GET', 'POST'])
+def recommend_song():
+    if request.method == 'POST':
+        params = request.get_json(silent=True) or {}
+    else:
+        params = request.args
+
+    try:
+        k = parse_k(params.get('k', 10))
+        mode = parse_mode(params.get('mode', CONTENT))
+        weight = parse_weight(params.get('weight', HYBRID_WEIGHT))
+    except (TypeError, ValueError) as e:
+        return jsonify(error=str(e)), 400
+
+    if params.get('row') is not None:
+        try:
+            row = int(params.get('row'))
+        except (TypeError, ValueError):
+            return jsonify(error="'row' must be an integer."), 400
+        try:
+            recommendations = recommend_row(row, k, mode, weight=weight)
+        except LOOKUP_ERRORS as e:
+            return jsonify(error=str(e)), 404
+        return jsonify(row=row, k=k, mode=mode, recommendations=to_records(recommendations))
+
+    song_name = str(params.get('song', '')).strip()
+    artist_name = str(params.get('artist', '')).strip()
+    if not song_name or not artist_name:
+        return jsonify(error="Either 'row' or both 'song' and 'artist' are required."), 400
+
+    name, artist = song_key(song_name, artist_name)
+    key = ("single", name, artist, k, mode, weight if mode == HYBRID else None)
+    records = cached_response(key)
+    if records is None:
+        try:
+            records = to_records(recommend(name, artist, k, mode, weight=weight))
+        except LOOKUP_ERRORS as e:
+            return jsonify(error=str(e)), 404
+        result_cache.put(key, records)
+
+    return jsonify(song=name, artist=artist, k=k, mode=mode, recommendations=records)
+
+
+@app.route('/recommend/batch', methods=['POST'])
+def recommend_batch():
+    params = request.get_json(silent=True) or {}
+    try:
+        seeds = params.get('seeds', [])
+        if not isinstance(seeds, list):
+            raise ValueError("seeds must be a list.")
+        seeds = [parse_seed(seed) for seed in seeds]
+        k = parse_k(params.get('k', 10))
+        mode = parse_mode(params.get('mode', CONTENT))
+        weight = parse_weight(params.get('weight', HYBRID_WEIGHT))
+        aggregate = parse_flag('aggregate', params.get('aggregate', False))
+    except (TypeError, ValueError) as e:
+        return jsonify(error=f"Invalid request: {e}"), 400
+    if not seeds or len(seeds) > MAX_BATCH_SEEDS:
+        return jsonify(error=f"Provide between 1 and {MAX_BATCH_SEEDS} seeds."), 400
+
+    key = ("batch", tuple(seeds), k, mode, aggregate, weight if mode == HYBRID else None)
+    response = cached_response(key)
+    if response is None:
+        models = get_models()
+        try:
+            if mode == CONTENT:
+                results = content_recommendation_batch(
+                    seeds, models.songs_data, models.transformed_data, models.song_lookup, k, aggregate,
+                    vector_store=models.vector_store, use_quantized=USE_QUANTIZED
+                )
+            elif mode == HYBRID:
+                results = hybrid_recommendation_batch(
+                    seeds, models.songs_data, models.vector_store, models.interaction_matrix,
+                    models.song_lookup, models.track_lookup, models.aligned_tracks, k, aggregate, weight
+                )
+            elif mode == ALS:
+                results = als_recommendation_batch(
+                    seeds, models.filtered_data, models.track_factors, models.filtered_lookup,
+                    models.track_lookup, models.song_rows, k, aggregate
+                )
+            else:
+                results = collaborative_recommendation_batch(
+                    seeds, models.filtered_data, models.interaction_matrix, models.filtered_lookup,
+                    models.track_lookup, models.song_rows, k, aggregate, normalized=True
+                )
+        except LOOKUP_ERRORS as e:
+            return jsonify(error=str(e)), 404
+
+        if aggregate:
+            response = {"recommendations": to_records(results)}
+        else:
+            response = {
+                "results": [
+                    {"song": name, "artist": artist, "recommendations": to_records(recommendations)}
+                    for (name, artist), recommendations in results.items()
+                ]
+            }
+        result_cache.put(key, response)
+
+    return jsonify(k=k, mode=mode, aggregate=aggregate, **response)
+
+
+def parse_space(value):
+    """Validate the user recommendation space."""
+    if value not in USER_SPACES:
+        raise ValueError(f"space must be one of {', '.join(USER_SPACES)}.")
+    return value
+
+
+@app.route('/recommend/user', methods=['GET'])
+def recommend_for_user():
+    user_id = request.args.get('user', '').strip()
+    if not user_id:
+        return jsonify(error="'user' is required."), 400
+    try:
+        k = parse_k(request.args.get('k', 10))
+        space = parse_space(request.args.get('space', USER_SPACES[0]))
+    except (TypeError, ValueError) as e:
+        return jsonify(error=str(e)), 400
+
+    try:
+        recommendations = recommend_user(user_id, k, space)
+    except LOOKUP_ERRORS as e:
+        return jsonify(error=str(e)), 404
+    return jsonify(user=user_id, k=k, space=space, recommendations=to_records(recommendations))
+
+
+@app.route('/recommend/users', methods=['POST'])
+def recommend_for_users():
+    params = request.get_json(silent=True) or {}
+    try:
+        user_ids = [str(user_id).strip() for user_id in params.get('users', [])]
+        k = parse_k(params.get('k', 10))
+        space = parse_space(params.get('space', USER_SPACES[0]))
+    except (TypeError, ValueError) as e:
+        return jsonify(error=f"Invalid request: {e}"), 400
+    if not user_ids or len(user_ids) > MAX_BATCH_USERS:
+        return jsonify(error=f"Provide between 1 and {MAX_BATCH_USERS} users."), 400
+
+    key = ("users", tuple(user_ids), k, space)
+    response = cached_response(key)
+    if response is None:
+        models = get_models()
+        try:
+            if space == CONTENT:
+                results = user_recommendation_batch(
+                    user_ids, models.user_lookup, models.user_tracks, models.interaction_matrix,
+                    models.songs_data, k, space, vector_store=models.vector_store,
+                    track_alignment=models.track_alignment
+                )
+            else:
+                results = user_recommendation_batch(
+                    user_ids, models.user_lookup, models.user_tracks, models.interaction_matrix,
+                    models.filtered_data, k, space, song_rows=models.song_rows
+                )
+        except LOOKUP_ERRORS as e:
+            return jsonify(error=str(e)), 404
+        response = {
+            "results": [
+                {"user": user_id, "recommendations": to_records(recommendations)}
+                for user_id, recommendations in results.items()
+            ]
+        }
+        result_cache.put(key, response)
+
+    return jsonify(k=k, space=space, **response)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return jsonify(
+        enabled=instrumentation.is_enabled(),
+        scope="all workers" if instrumentation.is_shared() else "this worker",
+        metrics=instrumentation.snapshot(),
+    )
+
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    app.run(debug=os.environ.get("FLASK_DEBUG") == "1", threaded=True)
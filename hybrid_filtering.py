@@ -0,0 +1,169 @@
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Union
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from instrumentation import stopwatch
+from ranking import aggregate_top_k, top_k_indices
+from song_lookup import SongNotFound, find_song, find_songs
+from vector_store import VectorStore
+
+# share of the content similarity in the blended score
+HYBRID_WEIGHT = 0.5
+RESULT_COLUMNS = ["name", "artist", "spotify_preview_url"]
+
+
+@dataclass
+class AlignedTracks:
+    """
+    The tracks both models can score: `matrix_rows[i]` (interaction matrix row)
+    and `content_rows[i]` (songs_data / vector store row) are the same track.
+    `positions` maps a content row to its candidate position, -1 when absent.
+    `content_vectors` and `interactions` hold the rows of the aligned tracks
+    only, in candidate order, so seeds are scored against the candidates alone.
+    """
+
+    matrix_rows: np.ndarray
+    content_rows: np.ndarray
+    positions: np.ndarray
+    content_vectors: VectorStore
+    interactions: csr_matrix
+
+
+def align_tracks(
+    track_alignment: np.ndarray, n_songs: int, vector_store: VectorStore, interaction_matrix: csr_matrix
+) -> AlignedTracks:
+    """Build the shared candidate set from the saved track alignment (see save_track_alignment)."""
+    track_alignment = np.asarray(track_alignment)
+    matrix_rows = np.flatnonzero(track_alignment >= 0)
+    content_rows = track_alignment[matrix_rows]
+    positions = np.full(n_songs, -1, dtype=np.int64)
+    positions[content_rows] = np.arange(len(content_rows))
+    return AlignedTracks(
+        matrix_rows, content_rows, positions,
+        vector_store.subset(content_rows), interaction_matrix[matrix_rows],
+    )
+
+
+def blended_scores(
+    content_rows: np.ndarray,
+    matrix_rows: np.ndarray,
+    vector_store: VectorStore,
+    interaction_matrix: csr_matrix,
+    aligned: AlignedTracks,
+    weight: float = HYBRID_WEIGHT
+) -> np.ndarray:
+    """
+    Blend content and collaborative cosine similarities of seeds to every aligned track.
+
+    `interaction_matrix` must be L2 row-normalized. Seeds without listening
+    history (matrix row -1) get a collaborative similarity of 0. The seeds are
+    multiplied with the aligned rows in `aligned` only, never the whole catalog.
+    Returns a (n_seeds, n_aligned) array.
+    """
+    content = aligned.content_vectors.query_scores(
+        vector_store.dense[content_rows], vector_store.sparse[content_rows]
+    )
+
+    collaborative = np.zeros_like(content)
+    known = np.flatnonzero(matrix_rows >= 0)
+    if len(known):
+        seed_vectors = interaction_matrix[matrix_rows[known]]
+        collaborative[known] = (aligned.interactions @ seed_vectors.T).toarray().T
+    return weight * content + (1.0 - weight) * collaborative
+
+
+def seed_matrix_rows(
+    content_rows: np.ndarray, songs_data: pd.DataFrame, track_lookup: Mapping[str, int]
+) -> np.ndarray:
+    """Interaction matrix row of each seed (-1 when the track has no listening history)."""
+    track_ids = songs_data["track_id"].take(content_rows)
+    return np.array([track_lookup.get(track_id, -1) for track_id in track_ids], dtype=np.int64)
+
+
+def hybrid_recommendation(
+    song_name: str,
+    artist_name: str,
+    songs_data: pd.DataFrame,
+    vector_store: VectorStore,
+    interaction_matrix: csr_matrix,
+    song_lookup: Mapping[tuple[str, str], int],
+    track_lookup: Mapping[str, int],
+    aligned: AlignedTracks,
+    k: int = 10,
+    weight: float = HYBRID_WEIGHT
+) -> pd.DataFrame:
+    """
+    Recommend songs by a weighted blend of content and collaborative similarity.
+
+    Both similarity vectors are computed over the aligned tracks only and
+    indexed by position, so no DataFrame merge is needed. The seed comes first,
+    followed by the k best blended matches. `weight` is the content share.
+    """
+    watch = stopwatch("hybrid")
+    content_row = find_song(song_lookup, song_name, artist_name)
+    if content_row is None:
+        raise SongNotFound("No matching song found for recommendation.")
+    content_rows = np.array([content_row])
+    matrix_rows = seed_matrix_rows(content_rows, songs_data, track_lookup)
+    watch.lap("lookup")
+
+    scores = blended_scores(content_rows, matrix_rows, vector_store, interaction_matrix, aligned, weight)[0]
+    watch.lap("similarity")
+
+    seed_position = aligned.positions[content_row]
+    if seed_position >= 0:
+        scores[seed_position] = -np.inf
+    top = top_k_indices(scores, k)
+    # the excluded seed comes back when there are fewer than k other candidates
+    top = top[np.isfinite(scores[top])]
+    watch.lap("ranking")
+
+    rows = np.concatenate([content_rows, aligned.content_rows[top]])
+    recommendations = songs_data.iloc[rows][RESULT_COLUMNS].reset_index(drop=True)
+    watch.lap("result")
+    return recommendations
+
+
+def hybrid_recommendation_batch(
+    seeds: list[tuple[str, str]],
+    songs_data: pd.DataFrame,
+    vector_store: VectorStore,
+    interaction_matrix: csr_matrix,
+    song_lookup: Mapping[tuple[str, str], int],
+    track_lookup: Mapping[str, int],
+    aligned: AlignedTracks,
+    k: int = 10,
+    aggregate: bool = False,
+    weight: float = HYBRID_WEIGHT
+) -> Union[dict[tuple[str, str], pd.DataFrame], pd.DataFrame]:
+    """
+    Blend content and collaborative similarity for many seeds in one pass.
+
+    Returns {(name, artist): DataFrame} as hybrid_recommendation would per seed,
+    or a single DataFrame of the k best mean blended scores when aggregate is True.
+    """
+    keys, content_rows = find_songs(song_lookup, seeds)
+    if len(content_rows) == 0:
+        raise SongNotFound("No matching seed songs found for recommendation.")
+    matrix_rows = seed_matrix_rows(content_rows, songs_data, track_lookup)
+
+    scores = blended_scores(content_rows, matrix_rows, vector_store, interaction_matrix, aligned, weight)
+    seed_positions = aligned.positions[content_rows]
+
+    if aggregate:
+        top = aggregate_top_k(scores, seed_positions[seed_positions >= 0], k)
+        return songs_data.iloc[aligned.content_rows[top]][RESULT_COLUMNS].reset_index(drop=True)
+
+    in_candidates = np.flatnonzero(seed_positions >= 0)
+    scores[in_candidates, seed_positions[in_candidates]] = -np.inf
+    top = top_k_indices(scores, k)
+    return {
+        key: songs_data.iloc[
+            np.concatenate([[content_row], aligned.content_rows[indices[np.isfinite(row_scores[indices])]]])
+        ][RESULT_COLUMNS].reset_index(drop=True)
+        for key, content_row, indices, row_scores in zip(keys, content_rows, top, scores)
+    }
@@ -0,0 +1,277 @@
+import glob
+import json
+import os
+import threading
+import time
+from typing import Any, Optional
+
+import numpy as np
+
+# Histogram bucket upper bounds in milliseconds (the last bucket is open ended)
+BUCKET_BOUNDS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf"))
+PERCENTILES = (50, 95, 99)
+
+# seconds between writes of a process's histograms to the shared metrics directory
+FLUSH_INTERVAL_S = 1.0
+# file in the shared metrics directory naming the current epoch; `reset` starts a new one
+EPOCH_FILE = "epoch"
+
+_enabled = os.environ.get("RECOMMENDER_METRICS", "1") != "0"
+# when set, every process writes its histograms here and snapshots merge all of them,
+# so a multi-worker server reports the latency of every worker
+_metrics_dir: Optional[str] = os.environ.get("RECOMMENDER_METRICS_DIR") or None
+_lock = threading.Lock()
+_histograms: dict[tuple[str, str], "Histogram"] = {}
+_metrics_file: Optional[str] = None
+_last_flush = 0.0
+# epoch the histograms of this process were recorded in (None until the first flush)
+_epoch: Optional[str] = None
+
+
+class Histogram:
+    """Fixed-bucket latency histogram in milliseconds."""
+
+    def __init__(self) -> None:
+        self.counts = np.zeros(len(BUCKET_BOUNDS_MS), dtype=np.int64)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, elapsed_ms: float) -> None:
+        """Record one observation."""
+        self.counts[np.searchsorted(BUCKET_BOUNDS_MS, elapsed_ms)] += 1
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def percentile(self, percentile: float) -> float:
+        """Approximate a percentile by the upper bound of the bucket that holds it."""
+        if self.count == 0:
+            return 0.0
+        rank = np.searchsorted(np.cumsum(self.counts), percentile / 100 * self.count)
+        return min(BUCKET_BOUNDS_MS[rank], self.max_ms)
+
+    def merge(self, other: "Histogram") -> None:
+        """Add the observations of another histogram."""
+        self.counts += other.counts
+        self.count += other.count
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+
+    def to_state(self) -> dict[str, Any]:
+        """Return the raw state written to the shared metrics directory."""
+        return {"counts": self.counts.tolist(), "count": self.count, "total_ms": self.total_ms, "max_ms": self.max_ms}
+
+    @classmethod
+    def from_state(cls, state: dict[str, Any]) -> "Histogram":
+        """Rebuild a histogram written with `to_state`."""
+        histogram = cls()
+        histogram.counts = np.asarray(state["counts"], dtype=np.int64)
+        histogram.count = state["count"]
+        histogram.total_ms = state["total_ms"]
+        histogram.max_ms = state["max_ms"]
+        return histogram
+
+    def to_dict(self) -> dict[str, Any]:
+        """Summarise the histogram for JSON output."""
+        summary = {
+            "count": self.count,
+            "mean_ms": self.total_ms / self.count if self.count else 0.0,
+            "max_ms": self.max_ms,
+        }
+        for percentile in PERCENTILES:
+            summary[f"p{percentile}_ms"] = self.percentile(percentile)
+        summary["buckets"] = {
+            ("+Inf" if np.isinf(bound) else str(bound)): int(count)
+            for bound, count in zip(BUCKET_BOUNDS_MS, self.counts)
+        }
+        return summary
+
+
+def record(mode: str, phase: str, elapsed_ms: float) -> None:
+    """Add one observation to the histogram of a (mode, phase) pair (no-op while disabled)."""
+    if not _enabled:
+        return
+    with _lock:
+        histogram = _histograms.get((mode, phase))
+        if histogram is None:
+            histogram = _histograms[(mode, phase)] = Histogram()
+        histogram.observe(elapsed_ms)
+    if _metrics_dir is not None and time.monotonic() - _last_flush >= FLUSH_INTERVAL_S:
+        flush()
+
+
+def _read_epoch() -> str:
+    """Return the current epoch of the shared metrics directory ("" before the first reset)."""
+    try:
+        with open(os.path.join(_metrics_dir, EPOCH_FILE)) as file:
+            return file.read()
+    except OSError:
+        return ""
+
+
+def flush() -> None:
+    """
+    Write this process's histograms to the shared metrics directory (no-op without one).
+
+    Each process owns one file, replaced atomically, so readers never see a
+    partial write and a restarted worker does not overwrite a previous one.
+    When another process has started a new epoch with `reset`, the histograms
+    of the old epoch are dropped first.
+    """
+    global _metrics_file, _last_flush, _epoch
+    if _metrics_dir is None:
+        return
+    with _lock:
+        _last_flush = time.monotonic()
+        epoch = _read_epoch()
+        if _epoch is not None and epoch != _epoch:
+            _histograms.clear()
+        _epoch = epoch
+        if not _histograms:
+            return
+        state = {
+            "epoch": epoch,
+            "histograms": [[mode, phase, histogram.to_state()] for (mode, phase), histogram in _histograms.items()],
+        }
+        if _metrics_file is None:
+            os.makedirs(_metrics_dir, exist_ok=True)
+            _metrics_file = os.path.join(_metrics_dir, f"{os.getpid()}-{time.time_ns()}.json")
+        temp_path = f"{_metrics_file}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(state, file)
+        os.replace(temp_path, _metrics_file)
+
+
+def _after_fork() -> None:
+    """Start a forked worker with empty histograms and its own metrics file."""
+    global _lock, _metrics_file, _last_flush, _epoch
+    _lock = threading.Lock()
+    _histograms.clear()
+    _metrics_file = None
+    _last_flush = 0.0
+    _epoch = None
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+class _Stopwatch:
+    """Records the time between consecutive laps as recommendation phases."""
+
+    __slots__ = ("mode", "last")
+
+    def __init__(self, mode: str) -> None:
+        self.mode = mode
+        self.last = time.perf_counter()
+
+    def lap(self, phase: str) -> None:
+        """Record the time since the previous lap (or creation) under `phase`."""
+        now = time.perf_counter()
+        record(self.mode, phase, (now - self.last) * 1000.0)
+        self.last = now
+
+
+class _NullStopwatch:
+    """Shared no-op stopwatch returned while instrumentation is disabled."""
+
+    __slots__ = ()
+
+    def lap(self, phase: str) -> None:
+        return None
+
+
+_NULL_STOPWATCH = _NullStopwatch()
+
+
+def stopwatch(mode: str):
+    """
+    Start timing a recommendation call for a filtering mode.
+
+    Call `.lap(phase)` after each phase (e.g. "lookup", "similarity", "ranking");
+    while instrumentation is disabled a shared no-op object is returned, so the
+    cost is one function call and one attribute lookup per phase.
+    """
+    return _Stopwatch(mode) if _enabled else _NULL_STOPWATCH
+
+
+def enable() -> None:
+    """Turn phase timing on."""
+    global _enabled
+    _enabled = True
+
+
+def disable() -> None:
+    """Turn phase timing off; timers become shared no-ops."""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    """Return whether phase timing is on."""
+    return _enabled
+
+
+def is_shared() -> bool:
+    """Return whether snapshots cover every process writing to RECOMMENDER_METRICS_DIR."""
+    return _metrics_dir is not None
+
+
+def reset() -> None:
+    """
+    Drop every recorded histogram.
+
+    With a shared metrics directory this starts a new epoch instead of deleting
+    files other processes own: snapshots only merge files of the current epoch,
+    and every process drops its old histograms at its next flush (observations
+    it made since its previous flush are dropped with them).
+    """
+    global _epoch
+    with _lock:
+        _histograms.clear()
+        if _metrics_dir is not None:
+            os.makedirs(_metrics_dir, exist_ok=True)
+            epoch = f"{os.getpid()}-{time.time_ns()}"
+            epoch_path = os.path.join(_metrics_dir, EPOCH_FILE)
+            with open(f"{epoch_path}.{os.getpid()}.tmp", "w") as file:
+                file.write(epoch)
+            os.replace(f"{epoch_path}.{os.getpid()}.tmp", epoch_path)
+            _epoch = epoch
+
+
+def snapshot() -> dict[str, dict[str, dict[str, Any]]]:
+    """
+    Return {mode: {phase: summary}} for every recorded phase.
+
+    Without a shared metrics directory this covers the current process only.
+    With one, the histograms every process recorded since the last `reset` are
+    merged; other processes' numbers lag by at most FLUSH_INTERVAL_S of activity.
+    """
+    if _metrics_dir is None:
+        with _lock:
+            merged = {key: histogram.to_dict() for key, histogram in _histograms.items()}
+    else:
+        flush()
+        epoch = _read_epoch()
+        histograms: dict[tuple[str, str], Histogram] = {}
+        for path in glob.glob(os.path.join(_metrics_dir, "*.json")):
+            try:
+                with open(path) as file:
+                    state = json.load(file)
+            except (OSError, ValueError):
+                continue
+            # files written before the current epoch (or by an older version) are stale
+            if not isinstance(state, dict) or state.get("epoch") != epoch:
+                continue
+            for mode, phase, histogram_state in state["histograms"]:
+                histogram = Histogram.from_state(histogram_state)
+                if (mode, phase) in histograms:
+                    histograms[(mode, phase)].merge(histogram)
+                else:
+                    histograms[(mode, phase)] = histogram
+        merged = {key: histogram.to_dict() for key, histogram in histograms.items()}
+
+    metrics: dict[str, dict[str, dict[str, Any]]] = {}
+    for (mode, phase), summary in sorted(merged.items()):
+        metrics.setdefault(mode, {})[phase] = summary
+    return metrics
@@ -0,0 +1,243 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from collections.abc import Mapping
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix, load_npz
+from sklearn.preprocessing import normalize
+
+# the recommenders import their lookup, ranking and timing helpers themselves,
+# so the train_als stage only depends on the modules it actually runs
+
+# File Paths
+INTERACTION_MATRIX_PATH = "data/interaction_matrix.npz"
+TRACK_FACTORS_SAVE_PATH = "data/track_factors.npy"
+USER_FACTORS_SAVE_PATH = "data/user_factors.npy"
+
+# ALS hyperparameters
+FACTORS = 64
+REGULARIZATION = 0.1
+ALPHA = 40.0
+ITERATIONS = 15
+# conjugate-gradient steps per row and half-step, warm-started from the previous factors
+CG_STEPS = 3
+# non-zeros per batched update; rows with more are updated on their own
+BLOCK_NNZ = 16384
+
+
+def plan_blocks(matrix: csr_matrix, block_nnz: int = BLOCK_NNZ) -> list[np.ndarray]:
+    """Group the non-empty rows into blocks of at most `block_nnz` non-zeros."""
+    row_nnz = np.diff(matrix.indptr)
+    blocks, current, current_nnz = [], [], 0
+    for row in np.flatnonzero(row_nnz):
+        if current and current_nnz + row_nnz[row] > block_nnz:
+            blocks.append(np.asarray(current))
+            current, current_nnz = [], 0
+        current.append(row)
+        current_nnz += row_nnz[row]
+    if current:
+        blocks.append(np.asarray(current))
+    return blocks
+
+
+def solve_block(
+    confidence: csr_matrix,
+    fixed: np.ndarray,
+    gram: np.ndarray,
+    rows: np.ndarray,
+    alpha: float,
+    current: np.ndarray,
+    cg_steps: int = CG_STEPS
+) -> np.ndarray:
+    """
+    Update the factors of a block of rows with a few conjugate-gradient steps.
+
+    For each row u the system is (YtY + Yt (C_u - I) Y + reg I) x_u = Yt C_u p_u,
+    with C_u = 1 + alpha * r_u on the observed entries and p_u = 1 there.
+    `gram` is YtY + reg I, shared by every row. The left-hand side is never
+    formed: each step applies it with one pass over the block's non-zeros, so
+    a step costs O(nnz * factors) instead of O(nnz * factors^2).
+    """
+    block = confidence[rows]
+    factors = fixed[block.indices]
+    weight = (alpha * block.data).astype(np.float32)
+    starts = block.indptr[:-1]
+    owner = np.repeat(np.arange(len(rows)), np.diff(block.indptr))
+
+    def apply_lhs(vectors: np.ndarray) -> np.ndarray:
+        dots = np.einsum("nf,nf->n", factors, vectors[owner])
+        return vectors @ gram + np.add.reduceat(factors * (weight * dots)[:, None], starts, axis=0)
+
+    solution = current[rows].copy()
+    rhs = np.add.reduceat(factors * (1.0 + weight)[:, None], starts, axis=0)
+    residual = rhs - apply_lhs(solution)
+    direction = residual.copy()
+    residual_norm = np.einsum("nf,nf->n", residual, residual)
+    for _ in range(cg_steps):
+        applied = apply_lhs(direction)
+        curvature = np.einsum("nf,nf->n", direction, applied)
+        step = np.divide(residual_norm, curvature, out=np.zeros_like(residual_norm), where=curvature > 0)
+        solution += step[:, None] * direction
+        residual -= step[:, None] * applied
+        new_norm = np.einsum("nf,nf->n", residual, residual)
+        ratio = np.divide(new_norm, residual_norm, out=np.zeros_like(new_norm), where=residual_norm > 0)
+        direction = residual + ratio[:, None] * direction
+        residual_norm = new_norm
+    return solution
+
+
+def als_step(
+    confidence: csr_matrix,
+    fixed: np.ndarray,
+    current: np.ndarray,
+    regularization: float,
+    alpha: float,
+    executor: ThreadPoolExecutor,
+    blocks: list[np.ndarray]
+) -> np.ndarray:
+    """Update the `current` factors of every row of `confidence` with the other side fixed."""
+    gram = fixed.T @ fixed + regularization * np.eye(fixed.shape[1], dtype=np.float32)
+    solved = np.zeros((confidence.shape[0], fixed.shape[1]), dtype=np.float32)
+
+    def run(rows: np.ndarray) -> None:
+        solved[rows] = solve_block(confidence, fixed, gram, rows, alpha, current)
+
+    list(executor.map(run, blocks))
+    return solved
+
+
+def train_als(
+    interaction_matrix: csr_matrix,
+    factors: int = FACTORS,
+    regularization: float = REGULARIZATION,
+    alpha: float = ALPHA,
+    iterations: int = ITERATIONS,
+    n_threads: Optional[int] = None,
+    seed: int = 0
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Factorize the track x user playcount matrix with implicit-feedback ALS.
+
+    Each half-step updates all rows in batched blocks on a thread pool with
+    warm-started conjugate gradient; NumPy releases the GIL inside the
+    vectorized products, so the work spreads over the cores.
+    Returns (track_factors, user_factors) as float32 arrays.
+    """
+    tracks = interaction_matrix.tocsr().astype(np.float32)
+    users = tracks.T.tocsr()
+    rng = np.random.default_rng(seed)
+    track_factors = rng.normal(0, 0.01, (tracks.shape[0], factors)).astype(np.float32)
+    user_factors = rng.normal(0, 0.01, (tracks.shape[1], factors)).astype(np.float32)
+
+    track_blocks = plan_blocks(tracks)
+    user_blocks = plan_blocks(users)
+    with ThreadPoolExecutor(max_workers=n_threads or os.cpu_count()) as executor:
+        for _ in range(iterations):
+            user_factors = als_step(
+                users, track_factors, user_factors, regularization, alpha, executor, user_blocks
+            )
+            track_factors = als_step(
+                tracks, user_factors, track_factors, regularization, alpha, executor, track_blocks
+            )
+    return track_factors, user_factors
+
+
+def normalize_factors(track_factors: np.ndarray) -> np.ndarray:
+    """L2-normalize track factors so a dot product is the cosine similarity."""
+    return np.ascontiguousarray(normalize(track_factors, norm="l2", axis=1), dtype=np.float32)
+
+
+def als_recommendation(
+    song_name: str,
+    artist_name: str,
+    songs_df: pd.DataFrame,
+    track_factors: np.ndarray,
+    song_lookup: Mapping[tuple[str, str], int],
+    track_lookup: Mapping[str, int],
+    song_rows: np.ndarray,
+    k: int = 5
+) -> pd.DataFrame:
+    """
+    Recommend songs by cosine similarity of ALS track embeddings.
+
+    `track_factors` must be normalized with `normalize_factors`. The query cost
+    depends on the number of tracks and factors only, not on the number of users.
+    Raises SongNotFound for tracks added to the interaction matrix after training.
+    """
+    from instrumentation import stopwatch
+    from ranking import top_k_indices
+    from song_lookup import SongNotFound, find_song
+
+    watch = stopwatch("als")
+    song_row = find_song(song_lookup, song_name, artist_name)
+    if song_row is None:
+        raise SongNotFound("No matching song found for recommendation.")
+    index = track_lookup.get(songs_df["track_id"].iat[song_row])
+    if index is None:
+        raise SongNotFound("Track ID not found in interaction matrix.")
+    if index >= len(track_factors):
+        raise SongNotFound("Track has no ALS embedding yet; it was added after the model was trained.")
+    watch.lap("lookup")
+
+    similarity = track_factors @ track_factors[index]
+    watch.lap("similarity")
+    top_indices = top_k_indices(similarity, k + 1)
+    watch.lap("ranking")
+
+    rows = song_rows[top_indices]
+    recommendations = songs_df.iloc[rows[rows >= 0]].drop(columns=["track_id"]).reset_index(drop=True)
+    watch.lap("merge")
+    return recommendations
+
+
+def als_recommendation_batch(
+    seeds: list[tuple[str, str]],
+    songs_df: pd.DataFrame,
+    track_factors: np.ndarray,
+    song_lookup: Mapping[tuple[str, str], int],
+    track_lookup: Mapping[str, int],
+    song_rows: np.ndarray,
+    k: int = 5,
+    aggregate: bool = False
+) -> Union[dict[tuple[str, str], pd.DataFrame], pd.DataFrame]:
+    """
+    Recommend songs for many seeds with one dense product against the track embeddings.
+
+    Returns the same shapes as collaborative_filtering.collaborative_recommendation_batch.
+    """
+    from ranking import aggregate_top_k, top_k_indices
+    from song_lookup import SongNotFound, find_seed_tracks
+
+    keys, matrix_rows = find_seed_tracks(song_lookup, track_lookup, songs_df, seeds)
+    # tracks ingested after training have no embedding
+    trained = [position for position, row in enumerate(matrix_rows) if row < len(track_factors)]
+    keys = [keys[position] for position in trained]
+    matrix_rows = [matrix_rows[position] for position in trained]
+
+    if not matrix_rows:
+        raise SongNotFound("No matching seed songs found for recommendation.")
+
+    similarity = track_factors[matrix_rows] @ track_factors.T
+
+    def to_frame(top_indices: np.ndarray) -> pd.DataFrame:
+        rows = song_rows[top_indices]
+        return songs_df.iloc[rows[rows >= 0]].drop(columns=["track_id"]).reset_index(drop=True)
+
+    if aggregate:
+        return to_frame(aggregate_top_k(similarity, np.asarray(matrix_rows), k))
+
+    top_indices = top_k_indices(similarity, k + 1)
+    return {key: to_frame(indices) for key, indices in zip(keys, top_indices)}
+
+
+def main() -> None:
+    """Train the ALS model on the interaction matrix and save both factor matrices."""
+    track_factors, user_factors = train_als(load_npz(INTERACTION_MATRIX_PATH))
+    np.save(TRACK_FACTORS_SAVE_PATH, track_factors)
+    np.save(USER_FACTORS_SAVE_PATH, user_factors)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Hashable, Optional
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from artifacts import BUNDLE_DIR, load_bundle, read_manifest
+from collaborative_filtering import collaborative_recommendation
+from content_based_filtering import content_recommendation
+from hybrid_filtering import HYBRID_WEIGHT, AlignedTracks, align_tracks, hybrid_recommendation
+from instrumentation import record
+from latent_factors import als_recommendation
+from search_index import SUGGESTION_LIMIT, SearchIndex, load_search_index, search
+from song_lookup import KeyLookup, SongLookup, SongNotFound, load_lookup, song_key
+from user_recommendations import USER_SPACES, user_recommendation
+from vector_store import VectorStore, load_vector_store
+
+# Filtering modes
+CONTENT = "content"
+COLLABORATIVE = "collaborative"
+ALS = "als"
+HYBRID = "hybrid"
+MODES = (CONTENT, COLLABORATIVE, ALS, HYBRID)
+# modes whose seeds come from songs_data rather than the filtered collaborative table
+CATALOG_MODES = (CONTENT, HYBRID)
+
+# how content mode scores a seed: "neighbors" reads the precomputed neighbour index
+# (live float32 scoring when it is too short), "float32" scores the vector store exactly
+# and "int8" selects candidates with the quantized copy and re-ranks them exactly
+CONTENT_SCORINGS = ("neighbors", "float32", "int8")
+CONTENT_SCORING = os.environ.get("RECOMMENDER_CONTENT_SCORING", "neighbors")
+if CONTENT_SCORING not in CONTENT_SCORINGS:
+    raise ValueError(f"RECOMMENDER_CONTENT_SCORING must be one of {', '.join(CONTENT_SCORINGS)}.")
+USE_QUANTIZED = CONTENT_SCORING == "int8"
+
+RESULT_CACHE_SIZE = 1024
+# seconds between checks of the bundle manifest for a new version
+RELOAD_CHECK_SECONDS = float(os.environ.get("RECOMMENDER_RELOAD_CHECK_SECONDS", "5"))
+
+
+@dataclass
+class Models:
+    """Every artifact the recommenders need, loaded once per process."""
+
+    version: str
+    songs_data: pd.DataFrame
+    transformed_data: csr_matrix
+    neighbor_index: tuple[np.ndarray, np.ndarray]
+    song_lookup: SongLookup
+    track_ids: np.ndarray
+    filtered_data: pd.DataFrame
+    interaction_matrix: csr_matrix
+    filtered_lookup: SongLookup
+    track_lookup: KeyLookup
+    song_rows: np.ndarray
+    collab_neighbor_index: tuple[np.ndarray, np.ndarray]
+    vector_store: VectorStore
+    track_factors: np.ndarray
+    search_index: SearchIndex
+    filtered_search_index: SearchIndex
+    aligned_tracks: AlignedTracks
+    track_alignment: np.ndarray
+    user_tracks: csr_matrix
+    user_lookup: KeyLookup
+
+
+class ResultCache:
+    """Thread-safe LRU cache with an optional time-to-live per entry."""
+
+    def __init__(self, maxsize: int = RESULT_CACHE_SIZE, ttl: Optional[float] = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value, or None when it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store a value, evicting the least recently used entry when full."""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_lock = threading.Lock()
+_models: Optional[Models] = None
+_version: Optional[str] = None
+_checked_at = float("-inf")
+_results = ResultCache()
+# caches built on top of the models (e.g. by the Flask app), cleared with _results
+_dependent_caches: list[ResultCache] = []
+
+
+def register_cache(cache: ResultCache) -> None:
+    """Clear `cache` together with the registry's own results whenever the bundle is reloaded."""
+    _dependent_caches.append(cache)
+
+
+def load_models(bundle_dir: str = BUNDLE_DIR) -> Models:
+    """Open the artifact bundle, including the lookups and search indexes saved in it."""
+    bundle = load_bundle(bundle_dir)
+    path = bundle["path"]
+    vector_store = load_vector_store(os.path.join(path, "content_vectors"))
+    interaction_matrix = bundle["interaction_matrix_normalized"]
+    return Models(
+        version=bundle["version"],
+        songs_data=bundle["songs_data"],
+        transformed_data=bundle["transformed_data"],
+        neighbor_index=bundle["neighbor_index"],
+        song_lookup=load_lookup(path, "song_lookup", SongLookup),
+        track_ids=bundle["track_ids"],
+        filtered_data=bundle["filtered_data"],
+        interaction_matrix=interaction_matrix,
+        filtered_lookup=load_lookup(path, "filtered_lookup", SongLookup),
+        track_lookup=load_lookup(path, "track_lookup"),
+        song_rows=bundle["song_rows"],
+        collab_neighbor_index=bundle["collab_neighbor_index"],
+        vector_store=vector_store,
+        track_factors=bundle["track_factors"],
+        search_index=load_search_index(path, "search_index"),
+        filtered_search_index=load_search_index(path, "filtered_search_index"),
+        aligned_tracks=align_tracks(
+            bundle["track_alignment"], len(bundle["songs_data"]), vector_store, interaction_matrix
+        ),
+        track_alignment=bundle["track_alignment"],
+        user_tracks=bundle["user_tracks"],
+        user_lookup=load_lookup(path, "user_lookup"),
+    )
+
+
+def get_models(bundle_dir: str = BUNDLE_DIR) -> Models:
+    """
+    Return the process-wide models, loading them on first use and reloading
+    them (and dropping cached results) when the bundle manifest names a new
+    version. The manifest is read at most once every RELOAD_CHECK_SECONDS.
+    """
+    global _models, _version, _checked_at
+    now = time.monotonic()
+    if _models is not None and now - _checked_at < RELOAD_CHECK_SECONDS:
+        return _models
+
+    version = read_manifest(bundle_dir)["version"]
+    _checked_at = now
+    if _models is not None and version == _version:
+        return _models
+
+    with _lock:
+        if _models is None or version != _version:
+            models = load_models(bundle_dir)
+            _models, _version = models, models.version
+            _results.clear()
+            for cache in _dependent_caches:
+                cache.clear()
+    return _models
+
+
+def recommend(
+    song_name: str,
+    artist_name: str,
+    k: int = 10,
+    mode: str = CONTENT,
+    bundle_dir: str = BUNDLE_DIR,
+    weight: float = HYBRID_WEIGHT
+) -> pd.DataFrame:
+    """
+    Recommend k songs for a seed song with the given filtering mode.
+
+    Results are kept in a process-wide LRU keyed on the normalized
+    (name, artist, k, mode) and, in hybrid mode, the content `weight`,
+    so repeated queries skip the computation.
+    Raises SongNotFound when the song is not available for the mode.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown filtering mode '{mode}'.")
+
+    start = time.perf_counter()
+    models = get_models(bundle_dir)
+    key = (*song_key(song_name, artist_name), k, mode, weight if mode == HYBRID else None)
+    cached = _results.get(key)
+    if cached is not None:
+        record(mode, "cache_hit", (time.perf_counter() - start) * 1000.0)
+        return cached.copy()
+
+    name, artist = key[0], key[1]
+    if mode == CONTENT:
+        recommendations = content_recommendation(
+            name, models.songs_data, models.transformed_data, k,
+            models.neighbor_index if CONTENT_SCORING == "neighbors" else None,
+            artist_name=artist, song_lookup=models.song_lookup, vector_store=models.vector_store,
+            use_quantized=USE_QUANTIZED
+        )
+    elif mode == HYBRID:
+        recommendations = hybrid_recommendation(
+            name, artist, models.songs_data, models.vector_store, models.interaction_matrix,
+            models.song_lookup, models.track_lookup, models.aligned_tracks, k, weight
+        )
+    elif mode == ALS:
+        recommendations = als_recommendation(
+            name, artist, models.filtered_data, models.track_factors, models.filtered_lookup,
+            models.track_lookup, models.song_rows, k
+        )
+    else:
+        recommendations = collaborative_recommendation(
+            name, artist, models.track_ids, models.filtered_data, models.interaction_matrix, k,
+            song_lookup=models.filtered_lookup, track_lookup=models.track_lookup,
+            normalized=True, song_rows=models.song_rows, neighbor_index=models.collab_neighbor_index
+        )
+
+    _results.put(key, recommendations)
+    record(mode, "total", (time.perf_counter() - start) * 1000.0)
+    return recommendations.copy()
+
+
+def suggest(
+    query: str,
+    limit: int = SUGGESTION_LIMIT,
+    mode: str = CONTENT,
+    bundle_dir: str = BUNDLE_DIR
+) -> list[tuple[str, str, int]]:
+    """
+    Autocomplete a partial or misspelled song name for the given filtering mode.
+
+    Returns (name, artist, row) suggestions; only songs the mode can recommend
+    for are suggested, and the row is meant for `recommend_row`.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown filtering mode '{mode}'.")
+    models = get_models(bundle_dir)
+    index = models.search_index if mode in CATALOG_MODES else models.filtered_search_index
+    return search(index, query, limit)
+
+
+def recommend_row(
+    row: int,
+    k: int = 10,
+    mode: str = CONTENT,
+    bundle_dir: str = BUNDLE_DIR,
+    weight: float = HYBRID_WEIGHT
+) -> pd.DataFrame:
+    """
+    Recommend k songs for a row returned by `suggest`.
+
+    The row indexes songs_data in content and hybrid mode and filtered_data otherwise.
+    Raises SongNotFound when the row is out of range.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown filtering mode '{mode}'.")
+    models = get_models(bundle_dir)
+    songs = models.songs_data if mode in CATALOG_MODES else models.filtered_data
+    if not 0 <= row < len(songs):
+        raise SongNotFound(f"Row {row} is out of range.")
+    return recommend(
+        str(songs["name"].iat[row]), str(songs["artist"].iat[row]), k, mode, bundle_dir, weight=weight
+    )
+
+
+def recommend_user(
+    user_id: str,
+    k: int = 10,
+    space: str = COLLABORATIVE,
+    bundle_dir: str = BUNDLE_DIR
+) -> pd.DataFrame:
+    """
+    Recommend k unplayed songs for a user of the listening history.
+
+    `space` is COLLABORATIVE (item-item similarity on the interaction matrix)
+    or CONTENT (similarity of the audio features of the played tracks).
+    Results share the process-wide LRU with `recommend`.
+    Raises UserNotFound when the user is unknown.
+    """
+    if space not in USER_SPACES:
+        raise ValueError(f"Unknown user recommendation space '{space}'.")
+
+    start = time.perf_counter()
+    models = get_models(bundle_dir)
+    key = ("user", user_id, k, space)
+    cached = _results.get(key)
+    if cached is not None:
+        record("user", "cache_hit", (time.perf_counter() - start) * 1000.0)
+        return cached.copy()
+
+    if space == CONTENT:
+        recommendations = user_recommendation(
+            user_id, models.user_lookup, models.user_tracks, models.interaction_matrix, models.songs_data, k,
+            space, vector_store=models.vector_store, track_alignment=models.track_alignment
+        )
+    else:
+        recommendations = user_recommendation(
+            user_id, models.user_lookup, models.user_tracks, models.interaction_matrix, models.filtered_data, k,
+            space, song_rows=models.song_rows
+        )
+
+    _results.put(key, recommendations)
+    record("user", "total", (time.perf_counter() - start) * 1000.0)
+    return recommendations.copy()
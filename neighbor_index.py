@@ -0,0 +1,253 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from scipy.sparse import load_npz
+from sklearn.preprocessing import normalize
+from ranking import top_k_indices
+
+# File Paths
+TRANSFORMED_DATA_PATH = "data/transformed_data.npz"
+NEIGHBOR_INDEX_PATH = "data/content_neighbors.npz"
+INTERACTION_MATRIX_PATH = "data/interaction_matrix.npz"
+COLLAB_NEIGHBOR_INDEX_PATH = "data/collab_neighbors.npz"
+
+# number of neighbours kept per track (the track itself is stored in front of them)
+NEIGHBOR_K = 20
+# upper bound on the rows scored at once; the actual block size also follows the memory budget
+BLOCK_SIZE = 1024
+# working memory for the score blocks of all workers together
+MEMORY_BUDGET_MB = 2048
+# bytes per (row, block row) score: float32 scores, their negation and the int64 argpartition output
+BYTES_PER_SCORE = 16
+# fewer workers are started rather than scoring blocks smaller than this
+MIN_BLOCK_SIZE = 64
+# vectors wider than this (the user columns of the interaction matrix) stay sparse while scoring
+DENSE_COLUMNS_LIMIT = 4096
+
+
+def similarity_block(normalized_data, block):
+    """
+    Score every row against a block of rows.
+
+    Narrow vectors (the content features) are scored against a dense copy of
+    the block. Wide vectors are multiplied sparse x sparse, so only the
+    (n_rows x block) result is densified and never a (n_columns x block) array.
+
+    Parameters:
+    normalized_data (scipy.sparse.csr_matrix): L2 row-normalized vectors.
+    block (scipy.sparse.csr_matrix): The rows to score, normalized the same way.
+
+    Returns:
+    np.ndarray: Similarities of shape (n_rows, n_block_rows).
+    """
+    if normalized_data.shape[1] > DENSE_COLUMNS_LIMIT:
+        return (normalized_data @ block.T).toarray()
+    return np.asarray(normalized_data @ block.T.toarray())
+
+
+def plan_blocks(n_rows, memory_budget_mb=MEMORY_BUDGET_MB, n_workers=None, max_block_size=BLOCK_SIZE):
+    """
+    Choose the worker count and block size that keep every concurrent score block in the budget.
+
+    One block scores `block_size` rows against all `n_rows` rows, so the
+    budget allows budget / (n_rows * BYTES_PER_SCORE) block rows in flight.
+    Workers are dropped until each gets at least MIN_BLOCK_SIZE of them
+    (or one row, for a single worker on a very large catalog).
+
+    Parameters:
+    n_rows (int): The number of rows being indexed.
+    memory_budget_mb (int, optional): Score block memory for all workers. Default is MEMORY_BUDGET_MB.
+    n_workers (int, optional): Requested worker processes. Default is the number of cores.
+    max_block_size (int, optional): Upper bound on the block size. Default is BLOCK_SIZE.
+
+    Returns:
+    tuple: (n_workers, block_size).
+    """
+    rows_in_budget = max(1, memory_budget_mb * 2**20 // (max(n_rows, 1) * BYTES_PER_SCORE))
+    n_workers = max(1, min(n_workers or os.cpu_count(), rows_in_budget // MIN_BLOCK_SIZE))
+    block_size = max(1, min(max_block_size, rows_in_budget // n_workers))
+    return n_workers, block_size
+
+
+def neighbor_block(normalized_data, start, end, width):
+    """
+    Compute the top neighbours for a contiguous block of rows.
+
+    Parameters:
+    normalized_data (scipy.sparse.csr_matrix): L2 row-normalized vectors.
+    start (int): First row of the block.
+    end (int): One past the last row of the block.
+    width (int): The number of neighbours to keep per row.
+
+    Returns:
+    tuple: (indices, scores) arrays of shape (end - start, width).
+    """
+    block_scores = similarity_block(normalized_data, normalized_data[start:end]).T
+    indices = top_k_indices(block_scores, width)
+    scores = np.take_along_axis(block_scores, indices, axis=1)
+    return indices.astype(np.int32), scores.astype(np.float32)
+
+
+_worker_data = None
+
+
+def _init_worker(normalized_data):
+    """Keep the normalized vectors in the worker process for every block it scores."""
+    global _worker_data
+    _worker_data = normalized_data
+
+
+def _worker_block(start, end, width):
+    """Score one block in a worker process."""
+    return (start,) + neighbor_block(_worker_data, start, end, width)
+
+
+def build_neighbor_index(transformed_data, k=NEIGHBOR_K, block_size=BLOCK_SIZE, n_workers=None,
+                         memory_budget_mb=MEMORY_BUDGET_MB):
+    """
+    Precompute the top k cosine neighbours of every row.
+
+    Rows are scored against the whole matrix in float32 blocks, one
+    (block_size x n_rows) score matrix per worker. The block size and the
+    number of workers are chosen with `plan_blocks` so all blocks in flight
+    fit in `memory_budget_mb`. Works for the content vectors and for the
+    track rows of the interaction matrix alike.
+
+    Parameters:
+    transformed_data (scipy.sparse.csr_matrix): The transformed song vectors.
+    k (int, optional): The number of neighbours per track. Default is NEIGHBOR_K.
+    block_size (int, optional): The largest number of rows scored at once. Default is BLOCK_SIZE.
+    n_workers (int, optional): Worker processes at most. Default is the number of cores.
+    memory_budget_mb (int, optional): Score block memory for all workers. Default is MEMORY_BUDGET_MB.
+
+    Returns:
+    tuple: (indices, scores) arrays of shape (n_tracks, k + 1), best first.
+    The first column is normally the track itself, matching the live results.
+    """
+    normalized_data = normalize(transformed_data.astype(np.float32), norm="l2", axis=1).tocsr()
+    n_rows = normalized_data.shape[0]
+    width = min(k + 1, n_rows)
+    n_workers, block_size = plan_blocks(n_rows, memory_budget_mb, n_workers, block_size)
+    blocks = [(start, min(start + block_size, n_rows)) for start in range(0, n_rows, block_size)]
+    n_workers = min(n_workers, len(blocks))
+
+    indices = np.empty((n_rows, width), dtype=np.int32)
+    scores = np.empty((n_rows, width), dtype=np.float32)
+    if n_workers <= 1:
+        for start, end in blocks:
+            indices[start:end], scores[start:end] = neighbor_block(normalized_data, start, end, width)
+        return indices, scores
+
+    with ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=(normalized_data,)) as executor:
+        futures = [executor.submit(_worker_block, start, end, width) for start, end in blocks]
+        for future in as_completed(futures):
+            start, block_indices, block_scores = future.result()
+            indices[start:start + len(block_indices)] = block_indices
+            scores[start:start + len(block_scores)] = block_scores
+
+    return indices, scores
+
+
+def extend_neighbor_index(indices, scores, transformed_data, block_size=BLOCK_SIZE,
+                          memory_budget_mb=MEMORY_BUDGET_MB):
+    """
+    Extend a neighbour index after new rows were appended to the transformed data.
+
+    The new rows get their neighbours from a full blocked scan. The existing
+    rows are only scored against the new rows, and those candidates are merged
+    with the neighbours they already have. The cost is proportional to
+    n_tracks x n_new_rows instead of n_tracks squared.
+
+    Parameters:
+    indices (np.ndarray): The existing neighbour indices, one row per existing track.
+    scores (np.ndarray): The existing neighbour scores.
+    transformed_data (scipy.sparse.csr_matrix): The vectors of all tracks, new ones last.
+    block_size (int, optional): The largest number of rows scored at once. Default is BLOCK_SIZE.
+    memory_budget_mb (int, optional): Score block memory. Default is MEMORY_BUDGET_MB.
+
+    Returns:
+    tuple: (indices, scores) arrays covering every row of transformed_data.
+    """
+    normalized_data = normalize(transformed_data.astype(np.float32), norm="l2", axis=1).tocsr()
+    n_existing, width = indices.shape
+    n_rows = normalized_data.shape[0]
+    if n_rows == n_existing:
+        return indices, scores
+    _, block_size = plan_blocks(n_rows, memory_budget_mb, 1, block_size)
+
+    new_rows = normalized_data[n_existing:]
+    merged_indices = np.empty((n_rows, width), dtype=np.int32)
+    merged_scores = np.empty((n_rows, width), dtype=np.float32)
+
+    for start in range(0, n_existing, block_size):
+        end = min(start + block_size, n_existing)
+        new_scores = similarity_block(normalized_data[start:end], new_rows)
+        new_columns = np.broadcast_to(np.arange(n_existing, n_rows), new_scores.shape)
+        candidate_indices = np.hstack([indices[start:end], new_columns])
+        candidate_scores = np.hstack([scores[start:end], new_scores])
+        top = top_k_indices(candidate_scores, width)
+        merged_indices[start:end] = np.take_along_axis(candidate_indices, top, axis=1)
+        merged_scores[start:end] = np.take_along_axis(candidate_scores, top, axis=1)
+
+    for start in range(n_existing, n_rows, block_size):
+        end = min(start + block_size, n_rows)
+        merged_indices[start:end], merged_scores[start:end] = neighbor_block(normalized_data, start, end, width)
+
+    return merged_indices, merged_scores
+
+
+def save_neighbor_index(indices, scores, save_path):
+    """
+    Save the neighbour index as an uncompressed NPZ archive.
+
+    Parameters:
+    indices (np.ndarray): Neighbour row indices.
+    scores (np.ndarray): Neighbour similarity scores.
+    save_path (str): The file path where the index will be saved.
+
+    Returns:
+    None
+    """
+    np.savez(save_path, indices=indices, scores=scores)
+
+
+def load_neighbor_index(path):
+    """
+    Load a neighbour index saved with `save_neighbor_index`.
+
+    Parameters:
+    path (str): The file path of the saved index.
+
+    Returns:
+    tuple: (indices, scores) arrays.
+    """
+    with np.load(path) as archive:
+        return archive["indices"], archive["scores"]
+
+
+def main(collaborative=False, memory_budget_mb=MEMORY_BUDGET_MB):
+    """
+    Build a neighbour index and save it.
+
+    Parameters:
+    collaborative (bool, optional): Index the track rows of the interaction matrix
+    instead of the content vectors. Default is False.
+    memory_budget_mb (int, optional): Score block memory for all workers. Default is MEMORY_BUDGET_MB.
+    """
+    if collaborative:
+        indices, scores = build_neighbor_index(load_npz(INTERACTION_MATRIX_PATH), memory_budget_mb=memory_budget_mb)
+        save_neighbor_index(indices, scores, COLLAB_NEIGHBOR_INDEX_PATH)
+    else:
+        indices, scores = build_neighbor_index(load_npz(TRANSFORMED_DATA_PATH), memory_budget_mb=memory_budget_mb)
+        save_neighbor_index(indices, scores, NEIGHBOR_INDEX_PATH)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the top neighbours of every track.")
+    parser.add_argument("--collaborative", action="store_true",
+                        help="index the interaction matrix instead of the content vectors")
+    parser.add_argument("--memory-budget-mb", type=int, default=MEMORY_BUDGET_MB,
+                        help="score block memory for all workers together")
+    args = parser.parse_args()
+    main(args.collaborative, args.memory_budget_mb)
@@ -0,0 +1,49 @@
+import numpy as np
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Return the indices of the k highest scores, best first.
+
+    Uses a partial selection (np.argpartition) so only the selected k entries
+    are sorted instead of the full score array. Works on a 1-D score vector or
+    row-wise on a 2-D score matrix.
+
+    Parameters:
+    scores (np.ndarray): 1-D scores or 2-D scores with one row per query.
+    k (int): The number of indices to select per row.
+
+    Returns:
+    np.ndarray: Indices of the top k scores in descending score order.
+    """
+    n = scores.shape[-1]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.intp)
+
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        candidates = np.broadcast_to(np.arange(n), scores.shape).copy()
+
+    candidate_scores = np.take_along_axis(scores, candidates, axis=-1)
+    order = np.argsort(-candidate_scores, axis=-1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=-1)
+
+
+def aggregate_top_k(scores: np.ndarray, exclude: np.ndarray, k: int) -> np.ndarray:
+    """
+    Return the k best columns of the mean score over all rows, skipping `exclude`.
+
+    Parameters:
+    scores (np.ndarray): 2-D scores with one row per seed.
+    exclude (np.ndarray): Column indices that must not be returned (e.g. the seeds).
+    k (int): The number of indices to select.
+
+    Returns:
+    np.ndarray: Column indices of the top k mean scores in descending score order.
+    """
+    combined = scores.mean(axis=0)
+    combined[exclude] = -np.inf
+    top = top_k_indices(combined, k)
+    return top[np.isfinite(combined[top])]
@@ -0,0 +1,167 @@
+import os
+from bisect import bisect_left
+from collections import defaultdict
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass
+
+import numpy as np
+
+from artifacts import load_array, load_strings, save_array, save_strings
+from ranking import top_k_indices
+from song_lookup import song_key
+
+# suggestions returned when no limit is given
+SUGGESTION_LIMIT = 10
+# minimum Dice similarity of trigram sets for a fuzzy match
+MIN_SIMILARITY = 0.3
+
+
+@dataclass
+class SearchIndex:
+    """
+    Prefix and typo-tolerant search over the song names of a catalog.
+
+    Every distinct (name, artist) pair is one entry pointing at the row of its
+    first occurrence, like song_lookup.build_song_lookup. Prefix queries bisect
+    the sorted names; fuzzy queries count shared character trigrams through an
+    inverted index, so both only touch the entries that can match.
+
+    The inverted index is flat: `grams` holds the sorted distinct trigrams and
+    the entries of grams[i] are gram_entries[gram_offsets[i]:gram_offsets[i + 1]].
+    Every field is an array or a string sequence, so the index can be saved in
+    the artifact bundle and memory mapped (see save_search_index).
+    """
+
+    names: Sequence[str]
+    artists: Sequence[str]
+    rows: np.ndarray
+    sorted_names: Sequence[str]
+    sorted_entries: np.ndarray
+    grams: np.ndarray
+    gram_offsets: np.ndarray
+    gram_entries: np.ndarray
+    gram_counts: np.ndarray
+
+
+def trigrams(text: str) -> set[str]:
+    """Return the character trigrams of a padded, normalized string."""
+    padded = f"  {text} "
+    return {padded[start:start + 3] for start in range(len(padded) - 2)}
+
+
+def build_search_index(song_lookup: Mapping[tuple[str, str], int]) -> SearchIndex:
+    """Build a SearchIndex from a (name, artist) -> row lookup."""
+    entries = list(song_lookup.items())
+    names = [name for (name, _), _ in entries]
+    artists = [artist for (_, artist), _ in entries]
+    rows = np.fromiter((row for _, row in entries), dtype=np.int64, count=len(entries))
+
+    sorted_entries = np.asarray(sorted(range(len(names)), key=names.__getitem__), dtype=np.int64)
+    sorted_names = [names[entry] for entry in sorted_entries]
+
+    postings: dict[str, list[int]] = defaultdict(list)
+    gram_counts = np.empty(len(names), dtype=np.int32)
+    for entry, name in enumerate(names):
+        grams = trigrams(name)
+        gram_counts[entry] = len(grams)
+        for gram in grams:
+            postings[gram].append(entry)
+
+    grams = sorted(postings)
+    gram_offsets = np.zeros(len(grams) + 1, dtype=np.int64)
+    np.cumsum([len(postings[gram]) for gram in grams], out=gram_offsets[1:])
+    return SearchIndex(
+        names=names,
+        artists=artists,
+        rows=rows,
+        sorted_names=sorted_names,
+        sorted_entries=sorted_entries,
+        grams=np.asarray(grams, dtype="U3"),
+        gram_offsets=gram_offsets,
+        gram_entries=np.fromiter(
+            (entry for gram in grams for entry in postings[gram]), dtype=np.int32, count=int(gram_offsets[-1])
+        ),
+        gram_counts=gram_counts,
+    )
+
+
+def save_search_index(index: SearchIndex, bundle_dir: str, name: str) -> None:
+    """Save a SearchIndex as raw .npy files and string buffers that can be memory mapped."""
+    index_dir = os.path.join(bundle_dir, name)
+    os.makedirs(index_dir, exist_ok=True)
+    for field in ("names", "artists", "sorted_names"):
+        save_strings(getattr(index, field), index_dir, field)
+    for field in ("rows", "sorted_entries", "grams", "gram_offsets", "gram_entries", "gram_counts"):
+        save_array(getattr(index, field), index_dir, field)
+
+
+def load_search_index(bundle_dir: str, name: str) -> SearchIndex:
+    """Open a SearchIndex saved with `save_search_index` without decoding or copying it."""
+    index_dir = os.path.join(bundle_dir, name)
+    return SearchIndex(
+        names=load_strings(index_dir, "names"),
+        artists=load_strings(index_dir, "artists"),
+        rows=load_array(index_dir, "rows"),
+        sorted_names=load_strings(index_dir, "sorted_names"),
+        sorted_entries=load_array(index_dir, "sorted_entries"),
+        grams=load_array(index_dir, "grams"),
+        gram_offsets=load_array(index_dir, "gram_offsets"),
+        gram_entries=load_array(index_dir, "gram_entries"),
+        gram_counts=load_array(index_dir, "gram_counts"),
+    )
+
+
+def prefix_search(index: SearchIndex, prefix: str, limit: int = SUGGESTION_LIMIT) -> list[int]:
+    """Return up to `limit` entries whose name starts with `prefix`, in alphabetical order."""
+    start = bisect_left(index.sorted_names, prefix)
+    entries = []
+    for position in range(start, min(start + limit, len(index.sorted_names))):
+        if not index.sorted_names[position].startswith(prefix):
+            break
+        entries.append(int(index.sorted_entries[position]))
+    return entries
+
+
+def fuzzy_search(
+    index: SearchIndex, query: str, limit: int = SUGGESTION_LIMIT, min_similarity: float = MIN_SIMILARITY
+) -> list[int]:
+    """Return up to `limit` entries ranked by trigram similarity to `query`, best first."""
+    all_grams = trigrams(query)
+    query_grams = np.asarray(sorted(all_grams), dtype="U3")
+    positions = np.searchsorted(index.grams, query_grams)
+    found = positions < len(index.grams)
+    positions = positions[found]
+    positions = positions[index.grams[positions] == query_grams[found]]
+    if not len(positions):
+        return []
+
+    candidates, shared = np.unique(
+        np.concatenate([
+            index.gram_entries[index.gram_offsets[position]:index.gram_offsets[position + 1]]
+            for position in positions.tolist()
+        ]),
+        return_counts=True,
+    )
+    similarity = 2.0 * shared / (len(all_grams) + index.gram_counts[candidates])
+    keep = similarity >= min_similarity
+    candidates, similarity = candidates[keep], similarity[keep]
+    return candidates[top_k_indices(similarity, limit)].tolist()
+
+
+def search(index: SearchIndex, query: str, limit: int = SUGGESTION_LIMIT) -> list[tuple[str, str, int]]:
+    """
+    Suggest songs for a partial or misspelled name.
+
+    Prefix matches come first, then fuzzy matches fill the remaining slots.
+    Returns (name, artist, row) tuples; the row can be passed to
+    model_registry.recommend_row.
+    """
+    query = song_key(query, "")[0]
+    if not query:
+        return []
+
+    entries = prefix_search(index, query, limit)
+    if len(entries) < limit:
+        seen = set(entries)
+        entries += [entry for entry in fuzzy_search(index, query, limit + len(entries)) if entry not in seen]
+    return [(index.names[entry], index.artists[entry], int(index.rows[entry])) for entry in entries[:limit]]
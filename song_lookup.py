@@ -0,0 +1,177 @@
+import os
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+from hashlib import blake2b
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from artifacts import load_array, load_strings, save_array, save_strings
+
+# joins name and artist into one lookup key; never part of a normalized name
+KEY_SEPARATOR = "\x1f"
+
+
+class SongNotFound(ValueError):
+    """A requested song, row or seed list is not in the catalog or the interaction matrix."""
+
+
+def song_key(song_name: str, artist_name: str) -> tuple[str, str]:
+    """Normalize a (name, artist) pair into a lookup key."""
+    return song_name.lower().strip(), artist_name.lower().strip()
+
+
+def key_hashes(keys: Iterable[str]) -> np.ndarray:
+    """Stable 64-bit hashes of string keys (unlike hash(), the same in every process)."""
+    return np.fromiter(
+        (int.from_bytes(blake2b(key.encode("utf-8"), digest_size=8).digest(), "little") for key in keys),
+        dtype=np.uint64,
+    )
+
+
+class KeyLookup(Mapping):
+    """
+    Read-only string key -> row mapping stored in three arrays, so it can be
+    saved in the artifact bundle and memory mapped instead of rebuilt as a dict.
+
+    Entries are ordered by a stable 64-bit hash of the key. `get` binary-searches
+    the hashes and compares only the keys with the same hash, so a lookup reads
+    a handful of entries and decodes one key.
+    """
+
+    def __init__(self, hashes: np.ndarray, keys: Sequence[str], rows: np.ndarray) -> None:
+        self.hashes = hashes
+        self.stored_keys = keys
+        self.rows = rows
+
+    @classmethod
+    def from_keys(cls, keys: list[str], rows: np.ndarray) -> "KeyLookup":
+        """Build a lookup from distinct encoded keys and their rows."""
+        hashes = key_hashes(keys)
+        order = np.argsort(hashes, kind="stable")
+        return cls(hashes[order], [keys[position] for position in order], np.asarray(rows, dtype=np.int64)[order])
+
+    def encode(self, key: Any) -> str:
+        """Turn a mapping key into the stored string key."""
+        return key
+
+    def decode(self, key: str) -> Any:
+        """Turn a stored string key back into the mapping key."""
+        return key
+
+    def get(self, key: Any, default: Optional[int] = None) -> Optional[int]:
+        try:
+            encoded = self.encode(key)
+        except (AttributeError, TypeError, ValueError):
+            return default
+        if not isinstance(encoded, str):
+            return default
+        target = key_hashes([encoded])[0]
+        position = int(np.searchsorted(self.hashes, target))
+        while position < len(self.hashes) and self.hashes[position] == target:
+            if self.stored_keys[position] == encoded:
+                return int(self.rows[position])
+            position += 1
+        return default
+
+    def __getitem__(self, key: Any) -> int:
+        row = self.get(key)
+        if row is None:
+            raise KeyError(key)
+        return row
+
+    def __contains__(self, key: Any) -> bool:
+        return self.get(key) is not None
+
+    def __iter__(self) -> Iterator[Any]:
+        return (self.decode(key) for key in self.stored_keys)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def values(self) -> np.ndarray:
+        return self.rows
+
+    def items(self) -> Iterator[tuple[Any, int]]:
+        return zip(iter(self), self.rows.tolist())
+
+
+class SongLookup(KeyLookup):
+    """KeyLookup over normalized (name, artist) pairs, see song_key."""
+
+    def encode(self, key: tuple[str, str]) -> str:
+        name, artist = key
+        return f"{name}{KEY_SEPARATOR}{artist}"
+
+    def decode(self, key: str) -> tuple[str, str]:
+        name, artist = key.split(KEY_SEPARATOR, 1)
+        return name, artist
+
+
+def build_song_lookup(songs: pd.DataFrame) -> SongLookup:
+    """Map each (name, artist) pair to the row position of its first occurrence."""
+    names = songs["name"].astype(str).str.lower().str.strip()
+    artists = songs["artist"].astype(str).str.lower().str.strip()
+    keys = (names + KEY_SEPARATOR + artists).reset_index(drop=True)
+    first = ~keys.duplicated()
+    return SongLookup.from_keys(keys[first].tolist(), np.flatnonzero(first.to_numpy()))
+
+
+def build_track_lookup(track_ids: Sequence[str]) -> KeyLookup:
+    """Map each track ID (or user ID) to its row in the interaction matrix."""
+    return KeyLookup.from_keys([str(track_id) for track_id in track_ids], np.arange(len(track_ids)))
+
+
+def save_lookup(lookup: KeyLookup, bundle_dir: str, name: str) -> None:
+    """Save a KeyLookup as raw .npy files and a string buffer that can be memory mapped."""
+    lookup_dir = os.path.join(bundle_dir, name)
+    os.makedirs(lookup_dir, exist_ok=True)
+    save_array(lookup.hashes, lookup_dir, "hashes")
+    save_strings(lookup.stored_keys, lookup_dir, "keys")
+    save_array(lookup.rows, lookup_dir, "rows")
+
+
+def load_lookup(bundle_dir: str, name: str, lookup_type: type[KeyLookup] = KeyLookup) -> KeyLookup:
+    """Open a lookup saved with `save_lookup` (a SongLookup with lookup_type=SongLookup) without copying it."""
+    lookup_dir = os.path.join(bundle_dir, name)
+    return lookup_type(
+        load_array(lookup_dir, "hashes"), load_strings(lookup_dir, "keys"), load_array(lookup_dir, "rows")
+    )
+
+
+def find_song(
+    lookup: Mapping[tuple[str, str], int], song_name: str, artist_name: str
+) -> Optional[int]:
+    """Return the row position of a song, or None when it is not in the lookup."""
+    return lookup.get(song_key(song_name, artist_name))
+
+
+def find_songs(
+    lookup: Mapping[tuple[str, str], int], seeds: list[tuple[str, str]]
+) -> tuple[list[tuple[str, str]], np.ndarray]:
+    """Resolve many (name, artist) seeds at once, dropping the ones not in the lookup."""
+    keys, rows = [], []
+    for song_name, artist_name in seeds:
+        key = song_key(song_name, artist_name)
+        row = lookup.get(key)
+        if row is not None:
+            keys.append(key)
+            rows.append(row)
+    return keys, np.asarray(rows, dtype=np.intp)
+
+
+def find_seed_tracks(
+    song_lookup: Mapping[tuple[str, str], int],
+    track_lookup: Mapping[str, int],
+    songs: pd.DataFrame,
+    seeds: list[tuple[str, str]]
+) -> tuple[list[tuple[str, str]], list[int]]:
+    """Resolve (name, artist) seeds to interaction matrix rows, dropping unknown seeds."""
+    seed_keys, seed_rows = find_songs(song_lookup, seeds)
+    keys, matrix_rows = [], []
+    for key, song_row in zip(seed_keys, seed_rows):
+        index = track_lookup.get(songs["track_id"].iat[song_row])
+        if index is not None:
+            keys.append(key)
+            matrix_rows.append(index)
+    return keys, matrix_rows
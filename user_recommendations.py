@@ -0,0 +1,242 @@
+import argparse
+import os
+from collections.abc import Mapping
+from typing import TYPE_CHECKING, Optional
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix, load_npz
+
+from ranking import top_k_indices
+
+if TYPE_CHECKING:
+    from vector_store import VectorStore
+
+# the vector store is only opened for the content space and user_recommendation
+# imports the timing helper itself, so the user_mixes stage only depends on the
+# modules it actually runs
+
+# File Paths
+INTERACTION_MATRIX_SAVE_PATH = "data/interaction_matrix.npz"
+NORMALIZED_MATRIX_SAVE_PATH = "data/interaction_matrix_normalized.npz"
+USER_IDS_SAVE_PATH = "data/user_ids.npy"
+TRACK_IDS_SAVE_PATH = "data/track_ids.npy"
+TRACK_ALIGNMENT_SAVE_PATH = "data/track_alignment.npy"
+SONGS_DATA_PATH = "data/cleaned_data.csv"
+VECTOR_STORE_DIR = "data/content_vectors"
+USER_MIXES_SAVE_PATH = "data/user_mixes.csv"
+
+# spaces a listener profile can be scored in
+COLLABORATIVE = "collaborative"
+CONTENT = "content"
+USER_SPACES = (COLLABORATIVE, CONTENT)
+
+USER_BLOCK_SIZE = 512
+RESULT_COLUMNS = ["name", "artist", "spotify_preview_url"]
+
+
+class UserNotFound(ValueError):
+    """A requested user (or every user of a batch) is not in the listening history."""
+
+
+def played_tracks(user_tracks: csr_matrix, user_rows: np.ndarray) -> csr_matrix:
+    """Binary (users x tracks) indicators of the tracks each user has played."""
+    played = user_tracks[user_rows]
+    return csr_matrix(
+        (np.ones(played.nnz, dtype=np.float32), played.indices, played.indptr), shape=played.shape
+    )
+
+
+def catalog_mapping(track_alignment: np.ndarray, n_songs: int) -> csr_matrix:
+    """Sparse (tracks x songs) matrix moving track indicators onto songs_data rows."""
+    track_alignment = np.asarray(track_alignment)
+    known = np.flatnonzero(track_alignment >= 0)
+    return csr_matrix(
+        (np.ones(len(known), dtype=np.float32), (known, track_alignment[known])),
+        shape=(len(track_alignment), n_songs),
+    )
+
+
+def score_users(
+    played: csr_matrix,
+    interaction_matrix: csr_matrix,
+    space: str = COLLABORATIVE,
+    vector_store: Optional["VectorStore"] = None,
+    track_alignment: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Score every item for a block of users, with their played tracks set to -inf.
+
+    In the collaborative space the profile is the sum of the user's normalized
+    track rows and the scores are the summed item-item cosine similarities, one
+    sparse product chain for the whole block; the columns are interaction matrix
+    rows. In the content space the played tracks are moved onto songs_data rows
+    with `track_alignment` and scored against the vector store; the columns are
+    songs_data rows.
+    """
+    if space == COLLABORATIVE:
+        scores = (interaction_matrix @ (played @ interaction_matrix).T).toarray().T
+        rows, columns = played.nonzero()
+        scores[rows, columns] = -np.inf
+        return scores
+
+    catalog_played = (played @ catalog_mapping(track_alignment, vector_store.dense.shape[0])).tocsr()
+    dense_profile = np.asarray(catalog_played @ vector_store.dense, dtype=np.float32)
+    sparse_profile = catalog_played @ vector_store.sparse
+    scores = (vector_store.dense @ dense_profile.T + (vector_store.sparse @ sparse_profile.T).toarray()).T
+    rows, columns = catalog_played.nonzero()
+    scores[rows, columns] = -np.inf
+    return scores
+
+
+def user_recommendation(
+    user_id: str,
+    user_lookup: Mapping[str, int],
+    user_tracks: csr_matrix,
+    interaction_matrix: csr_matrix,
+    songs_df: pd.DataFrame,
+    k: int = 10,
+    space: str = COLLABORATIVE,
+    song_rows: Optional[np.ndarray] = None,
+    vector_store: Optional["VectorStore"] = None,
+    track_alignment: Optional[np.ndarray] = None
+) -> pd.DataFrame:
+    """
+    Recommend k unplayed songs for a listener from their listening history.
+
+    `user_tracks` is the (users x tracks) transpose of the interaction matrix and
+    `user_lookup` maps user IDs to its rows. In the collaborative space `songs_df`
+    is the filtered collaborative table and `song_rows` maps tracks onto it (see
+    collaborative_filtering.build_song_rows); in the content space `songs_df` is
+    songs_data and `vector_store` and `track_alignment` are required.
+    """
+    from instrumentation import stopwatch
+
+    watch = stopwatch("user")
+    user_row = user_lookup.get(user_id)
+    if user_row is None:
+        raise UserNotFound(f"User '{user_id}' not found in the listening history.")
+    played = played_tracks(user_tracks, np.array([user_row]))
+    watch.lap("lookup")
+
+    scores = score_users(played, interaction_matrix, space, vector_store, track_alignment)[0]
+    watch.lap("similarity")
+    top = top_k_indices(scores, k)
+    top = top[np.isfinite(scores[top])]
+    watch.lap("ranking")
+
+    rows = song_rows[top] if space == COLLABORATIVE else top
+    recommendations = songs_df.iloc[rows[rows >= 0]][RESULT_COLUMNS].reset_index(drop=True)
+    watch.lap("result")
+    return recommendations
+
+
+def user_recommendation_batch(
+    user_ids: list[str],
+    user_lookup: Mapping[str, int],
+    user_tracks: csr_matrix,
+    interaction_matrix: csr_matrix,
+    songs_df: pd.DataFrame,
+    k: int = 10,
+    space: str = COLLABORATIVE,
+    song_rows: Optional[np.ndarray] = None,
+    vector_store: Optional["VectorStore"] = None,
+    track_alignment: Optional[np.ndarray] = None,
+    block_size: int = USER_BLOCK_SIZE
+) -> dict[str, pd.DataFrame]:
+    """
+    Recommend for many listeners, scoring `block_size` users per sparse product.
+
+    Takes the same arguments as user_recommendation; unknown users are skipped.
+    """
+    known = [user_id for user_id in user_ids if user_id in user_lookup]
+    if not known:
+        raise UserNotFound("None of the users were found in the listening history.")
+
+    results = {}
+    for start in range(0, len(known), block_size):
+        block = known[start:start + block_size]
+        played = played_tracks(user_tracks, np.array([user_lookup[user_id] for user_id in block]))
+        scores = score_users(played, interaction_matrix, space, vector_store, track_alignment)
+        top = top_k_indices(scores, k)
+        for user_id, user_scores, indices in zip(block, scores, top):
+            indices = indices[np.isfinite(user_scores[indices])]
+            rows = song_rows[indices] if space == COLLABORATIVE else indices
+            results[user_id] = songs_df.iloc[rows[rows >= 0]][RESULT_COLUMNS].reset_index(drop=True)
+    return results
+
+
+def generate_user_mixes(
+    user_ids: np.ndarray,
+    user_tracks: csr_matrix,
+    interaction_matrix: csr_matrix,
+    item_ids: np.ndarray,
+    save_path: str,
+    k: int = 10,
+    space: str = COLLABORATIVE,
+    vector_store: Optional["VectorStore"] = None,
+    track_alignment: Optional[np.ndarray] = None,
+    block_size: int = USER_BLOCK_SIZE
+) -> int:
+    """
+    Write the top k unplayed tracks of every user to a CSV (user_id, rank, track_id, score).
+
+    Users are scored in blocks and each block is appended as soon as it is
+    ranked, so memory stays at one (block_size x n_items) score matrix.
+    `item_ids` are the track IDs of the score columns: track_ids.npy in the
+    collaborative space, the songs_data track_id column in the content space.
+    Returns the number of rows written.
+    """
+    n_rows = 0
+    for start in range(0, len(user_ids), block_size):
+        user_rows = np.arange(start, min(start + block_size, len(user_ids)))
+        played = played_tracks(user_tracks, user_rows)
+        scores = score_users(played, interaction_matrix, space, vector_store, track_alignment)
+        top = top_k_indices(scores, k)
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        keep = np.isfinite(top_scores)
+
+        mixes = pd.DataFrame({
+            "user_id": np.repeat(np.asarray(user_ids)[user_rows], top.shape[1])[keep.ravel()],
+            "rank": np.tile(np.arange(1, top.shape[1] + 1), len(user_rows))[keep.ravel()],
+            "track_id": np.asarray(item_ids)[top[keep]],
+            "score": top_scores[keep],
+        })
+        mixes.to_csv(save_path, mode="w" if start == 0 else "a", header=start == 0, index=False)
+        n_rows += len(mixes)
+    return n_rows
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """Generate the nightly mixes of every user from the pipeline outputs."""
+    parser = argparse.ArgumentParser(description="Recommend unplayed tracks for every user in the history.")
+    parser.add_argument("--space", choices=USER_SPACES, default=COLLABORATIVE)
+    parser.add_argument("-k", type=int, default=10, help="tracks per user")
+    parser.add_argument("--block-size", type=int, default=USER_BLOCK_SIZE, help="users scored per product")
+    parser.add_argument("--output", default=USER_MIXES_SAVE_PATH)
+    args = parser.parse_args(argv)
+
+    user_tracks = load_npz(INTERACTION_MATRIX_SAVE_PATH).T.tocsr()
+    interaction_matrix = load_npz(NORMALIZED_MATRIX_SAVE_PATH).tocsr()
+    user_ids = np.load(USER_IDS_SAVE_PATH, allow_pickle=True)
+
+    if args.space == COLLABORATIVE:
+        vector_store, track_alignment = None, None
+        item_ids = np.load(TRACK_IDS_SAVE_PATH, allow_pickle=True)
+    else:
+        from vector_store import load_vector_store
+
+        vector_store = load_vector_store(VECTOR_STORE_DIR)
+        track_alignment = np.load(TRACK_ALIGNMENT_SAVE_PATH)
+        item_ids = pd.read_csv(SONGS_DATA_PATH, usecols=["track_id"])["track_id"].to_numpy()
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    n_rows = generate_user_mixes(
+        user_ids, user_tracks, interaction_matrix, item_ids, args.output, args.k, args.space,
+        vector_store, track_alignment, args.block_size
+    )
+    print(f"Wrote {n_rows} recommendations for {len(user_ids)} users to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from scipy.sparse import csr_matrix, load_npz, vstack
+from sklearn.preprocessing import normalize
+
+from artifacts import load_array, load_csr, save_array, save_csr
+# the query methods import the ranking helpers themselves, so the vector_store
+# stage only depends on the modules it actually runs
+
+# File Paths
+TRANSFORMED_DATA_PATH = "data/transformed_data.npz"
+VECTOR_STORE_DIR = "data/content_vectors"
+
+# columns with at least this share of non-zeros go to the dense block
+DENSE_DENSITY_THRESHOLD = 0.3
+# rows converted from int8 to float32 at a time during the quantized scan
+SCAN_BLOCK_ROWS = 65536
+# candidates re-ranked exactly per requested neighbour in the quantized path
+CANDIDATE_FACTOR = 10
+MIN_CANDIDATES = 200
+
+
+@dataclass
+class VectorStore:
+    """
+    L2-normalized content vectors split into a contiguous float32 block for the
+    mostly dense columns (scaled numeric, frequency-encoded and TF-IDF features)
+    and a float32 CSR block for the sparse one-hot columns, with an optional
+    int8 copy of the dense block (per-row scales) for a cheaper first pass.
+    """
+
+    dense: np.ndarray
+    sparse: csr_matrix
+    dense_columns: np.ndarray
+    sparse_columns: np.ndarray
+    quantized: Optional[np.ndarray] = None
+    scales: Optional[np.ndarray] = None
+
+    def exact_scores(self, row, candidates=None):
+        """Cosine similarity of `row` to every row (or to `candidates`), in float32."""
+        query_dense = self.dense[row]
+        query_sparse = self.sparse[row].T
+        if candidates is None:
+            return self.dense @ query_dense + (self.sparse @ query_sparse).toarray().ravel()
+        return (
+            self.dense[candidates] @ query_dense
+            + (self.sparse[candidates] @ query_sparse).toarray().ravel()
+        )
+
+    def batch_scores(self, rows):
+        """Cosine similarity of several rows to every row, shape (len(rows), n_rows)."""
+        return self.query_scores(self.dense[rows], self.sparse[rows])
+
+    def query_scores(self, dense_queries, sparse_queries):
+        """Cosine similarity of query vectors split like this store to every row, shape (n_queries, n_rows)."""
+        dense_scores = self.dense @ dense_queries.T
+        sparse_scores = (self.sparse @ sparse_queries.T).toarray()
+        return (dense_scores + sparse_scores).T
+
+    def subset(self, rows):
+        """Return a store holding only `rows`, in that order (the arrays are copied)."""
+        return VectorStore(
+            np.ascontiguousarray(self.dense[rows]),
+            self.sparse[rows],
+            self.dense_columns,
+            self.sparse_columns,
+            None if self.quantized is None else self.quantized[rows],
+            None if self.scales is None else self.scales[rows],
+        )
+
+    def candidate_scores(self, rows, candidates):
+        """Cosine similarity of several rows to the `candidates` rows, shape (len(rows), len(candidates))."""
+        dense_scores = self.dense[candidates] @ self.dense[rows].T
+        sparse_scores = (self.sparse[candidates] @ self.sparse[rows].T).toarray()
+        return (dense_scores + sparse_scores).T
+
+    def approximate_batch_scores(self, rows):
+        """Cosine similarity of several rows to every row using the int8 dense block."""
+        queries = self.dense[rows].T
+        scores = (self.sparse @ self.sparse[rows].T).toarray().astype(np.float32)
+        for start in range(0, self.quantized.shape[0], SCAN_BLOCK_ROWS):
+            end = start + SCAN_BLOCK_ROWS
+            block = self.quantized[start:end].astype(np.float32)
+            scores[start:end] += (block @ queries) * self.scales[start:end, None]
+        return scores.T
+
+    def approximate_scores(self, row):
+        """Cosine similarity of `row` to every row using the int8 dense block."""
+        query = self.dense[row]
+        scores = (self.sparse @ self.sparse[row].T).toarray().ravel()
+        for start in range(0, self.quantized.shape[0], SCAN_BLOCK_ROWS):
+            end = start + SCAN_BLOCK_ROWS
+            block = self.quantized[start:end].astype(np.float32)
+            scores[start:end] += (block @ query) * self.scales[start:end]
+        return scores
+
+    def top_k(self, row, k, use_quantized=False):
+        """
+        Return the rows of the k most similar vectors, best first.
+
+        With `use_quantized` the int8 block selects candidates that are then
+        re-ranked with the exact float32 scores.
+        """
+        from ranking import top_k_indices
+
+        if not use_quantized or self.quantized is None:
+            return top_k_indices(self.exact_scores(row), k)
+
+        n_candidates = max(k * CANDIDATE_FACTOR, MIN_CANDIDATES)
+        candidates = top_k_indices(self.approximate_scores(row), n_candidates)
+        return candidates[top_k_indices(self.exact_scores(row, candidates), k)]
+
+    def batch_top_k(self, rows, k, use_quantized=False):
+        """Return the k most similar rows for each of `rows`, shape (len(rows), k), best first."""
+        from ranking import top_k_indices
+
+        if not use_quantized or self.quantized is None:
+            return top_k_indices(self.batch_scores(rows), k)
+
+        n_candidates = max(k * CANDIDATE_FACTOR, MIN_CANDIDATES)
+        candidates = top_k_indices(self.approximate_batch_scores(rows), n_candidates)
+        exact = np.stack([
+            self.exact_scores(row, row_candidates) for row, row_candidates in zip(rows, candidates)
+        ])
+        return np.take_along_axis(candidates, top_k_indices(exact, k), axis=1)
+
+    def aggregate_top_k(self, rows, k, use_quantized=False):
+        """Return the k rows with the best mean similarity to all `rows`, excluding them."""
+        from ranking import aggregate_top_k, top_k_indices
+
+        if not use_quantized or self.quantized is None:
+            return aggregate_top_k(self.batch_scores(rows), rows, k)
+
+        n_candidates = max(k * CANDIDATE_FACTOR, MIN_CANDIDATES)
+        candidates = aggregate_top_k(self.approximate_batch_scores(rows), rows, n_candidates)
+        return candidates[top_k_indices(self.candidate_scores(rows, candidates).mean(axis=0), k)]
+
+
+def quantize_rows(dense):
+    """
+    Quantize each row to int8 with its own scale.
+
+    Parameters:
+    dense (np.ndarray): float32 matrix.
+
+    Returns:
+    tuple: (int8 matrix, float32 per-row scales) with dense ~= quantized * scales[:, None].
+    """
+    scales = np.abs(dense).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.rint(dense / scales[:, None]).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+def build_vector_store(transformed_data, density_threshold=DENSE_DENSITY_THRESHOLD, quantize=True):
+    """
+    Build a VectorStore from the transformed song vectors.
+
+    Parameters:
+    transformed_data (scipy.sparse matrix): The transformed song vectors.
+    density_threshold (float, optional): Minimum share of non-zeros for a column to be stored densely.
+    quantize (bool, optional): Also build the int8 copy of the dense block. Default is True.
+
+    Returns:
+    VectorStore: The normalized, split vectors.
+    """
+    normalized_data = normalize(transformed_data, norm="l2", axis=1).tocsc().astype(np.float32)
+    density = np.diff(normalized_data.indptr) / max(normalized_data.shape[0], 1)
+    dense_columns = np.flatnonzero(density >= density_threshold)
+    sparse_columns = np.flatnonzero(density < density_threshold)
+
+    dense = np.ascontiguousarray(normalized_data[:, dense_columns].toarray())
+    sparse = normalized_data[:, sparse_columns].tocsr()
+    quantized, scales = quantize_rows(dense) if quantize else (None, None)
+    return VectorStore(dense, sparse, dense_columns, sparse_columns, quantized, scales)
+
+
+def extend_vector_store(store, new_transformed_data):
+    """
+    Append the vectors of new songs to a VectorStore, keeping its column split.
+
+    Parameters:
+    store (VectorStore): The existing store.
+    new_transformed_data (scipy.sparse matrix): The transformed vectors of the new songs.
+
+    Returns:
+    VectorStore: A store covering the existing and the new rows.
+    """
+    normalized_data = normalize(new_transformed_data, norm="l2", axis=1).tocsc().astype(np.float32)
+    dense = normalized_data[:, store.dense_columns].toarray()
+    sparse = normalized_data[:, store.sparse_columns].tocsr()
+
+    quantized, scales = None, None
+    if store.quantized is not None:
+        new_quantized, new_scales = quantize_rows(dense)
+        quantized = np.concatenate([store.quantized, new_quantized])
+        scales = np.concatenate([store.scales, new_scales])
+    return VectorStore(
+        np.ascontiguousarray(np.concatenate([store.dense, dense])),
+        vstack([store.sparse, sparse]).tocsr(),
+        np.asarray(store.dense_columns),
+        np.asarray(store.sparse_columns),
+        quantized,
+        scales,
+    )
+
+
+def save_vector_store(store, store_dir):
+    """
+    Save a VectorStore as raw .npy files that can be memory mapped.
+
+    Parameters:
+    store (VectorStore): The store to save.
+    store_dir (str): The directory to write to.
+
+    Returns:
+    None
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    save_array(store.dense, store_dir, "dense")
+    save_csr(store.sparse, store_dir, "sparse")
+    save_array(store.dense_columns, store_dir, "dense_columns")
+    save_array(store.sparse_columns, store_dir, "sparse_columns")
+    if store.quantized is not None:
+        save_array(store.quantized, store_dir, "quantized")
+        save_array(store.scales, store_dir, "scales")
+
+
+def load_vector_store(store_dir):
+    """
+    Open a VectorStore saved with `save_vector_store` (arrays are memory mapped).
+
+    Parameters:
+    store_dir (str): The directory the store was saved to.
+
+    Returns:
+    VectorStore: The opened store.
+    """
+    has_quantized = os.path.exists(os.path.join(store_dir, "quantized.npy"))
+    return VectorStore(
+        dense=load_array(store_dir, "dense"),
+        sparse=load_csr(store_dir, "sparse"),
+        dense_columns=load_array(store_dir, "dense_columns"),
+        sparse_columns=load_array(store_dir, "sparse_columns"),
+        quantized=load_array(store_dir, "quantized") if has_quantized else None,
+        scales=load_array(store_dir, "scales") if has_quantized else None,
+    )
+
+
+def main():
+    """
+    Build the content vector store from the transformed data and save it.
+    """
+    save_vector_store(build_vector_store(load_npz(TRANSFORMED_DATA_PATH)), VECTOR_STORE_DIR)
+
+
+if __name__ == "__main__":
+    main()